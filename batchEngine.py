@@ -0,0 +1,284 @@
+# batchEngine.py
+# --------------
+# A vectorized forward model that advances many Pacman games at once.
+
+"""
+BatchGameState holds N classic Pacman games as NumPy arrays (one row per game)
+and advances all of them by one full round per call to step(), following the
+same rules as PacmanRules and GhostRules in pacman.py:
+
+  posX, posY    (N, agents)  agent positions in half-cell units
+  direction     (N, agents)  agent travel direction, as an action code
+  scared        (N, agents)  scared timers (ghosts only)
+  food          (N, cells)   food mask, cell = x * height + y
+  capsules      (N, cells)   capsule mask
+  numFood       (N,)         food left
+  score         (N,)         game score
+  win, lose     (N,)         terminal flags
+
+Actions are the engine's integer action codes (Actions.actionToCode), which
+index ACTIONS.  Ghosts reply uniformly at random among their legal actions,
+like generatePacmanSuccessor.  Games that have ended are left untouched by
+later steps.  This module needs NumPy; the rest of the game does not.
+
+  batch = BatchGameState.fromLayout(layout.getLayout('mediumClassic'), 1000)
+  while not batch.isOver().all():
+      batch.step(batch.randomPacmanActions())
+  print batch.score.mean()
+"""
+
+import numpy as np
+from game import Actions
+import pacman
+
+# The engine's own action codes
+ACTIONS = list(Actions._codeToAction)
+ACTION_CODES = Actions._actionToCode
+STOP = Actions.STOP_CODE
+DX = np.array([dx for dx, dy in Actions._codeVectors])
+DY = np.array([dy for dx, dy in Actions._codeVectors])
+
+KILL_DISTANCE = pacman.KILL_DISTANCE # in half cells
+
+class BatchTables:
+    """
+    Per-layout lookup tables shared by every batch on that layout, built from
+    the layout's move tables:
+
+      pacmanLegal[cell, action]            Pacman may take action on cell
+      ghostLegal[cell, direction, action]  a ghost on cell that arrived
+                                           travelling in direction may take action
+    """
+    def __init__(self, layout):
+        self.layout = layout
+        self.width = layout.width
+        self.height = layout.height
+        numCells = self.width * self.height
+        numActions = len(ACTIONS)
+        self.pacmanLegal = np.zeros((numCells, numActions), bool)
+        self.ghostLegal = np.zeros((numCells, numActions, numActions), bool)
+        for (x, y), codes in layout.legalCodes.items():
+            self.pacmanLegal[x * self.height + y, list(codes)] = True
+        for ((x, y), direction), codes in layout.ghostCodes.items():
+            self.ghostLegal[x * self.height + y, direction, list(codes)] = True
+
+_TABLES = {}
+
+def getTables(layout):
+    if layout not in _TABLES:
+        _TABLES[layout] = BatchTables(layout)
+    return _TABLES[layout]
+
+class BatchGameState:
+    """
+    N Pacman games stored as arrays.  Build one with fromLayout or
+    fromGameStates rather than calling the constructor directly.
+    """
+    def __init__(self, layout, numStates, numAgents, seed=None):
+        self.tables = getTables(layout)
+        self.numStates = numStates
+        self.numAgents = numAgents
+        numCells = layout.width * layout.height
+        self.posX = np.zeros((numStates, numAgents), np.int32)
+        self.posY = np.zeros((numStates, numAgents), np.int32)
+        self.direction = np.zeros((numStates, numAgents), np.int8)
+        self.scared = np.zeros((numStates, numAgents), np.int32)
+        self.startX = np.zeros(numAgents, np.int32)
+        self.startY = np.zeros(numAgents, np.int32)
+        self.food = np.zeros((numStates, numCells), bool)
+        self.capsules = np.zeros((numStates, numCells), bool)
+        self.numFood = np.zeros(numStates, np.int32)
+        self.score = np.zeros(numStates, np.int64)
+        self.win = np.zeros(numStates, bool)
+        self.lose = np.zeros(numStates, bool)
+        self.random = np.random.RandomState(seed)
+
+    def fromLayout(layout, numStates, numGhosts=1000, seed=None):
+        """
+        Returns numStates copies of the initial state of layout, with at most
+        numGhosts ghosts (as in GameState.initialize).
+        """
+        state = pacman.GameState()
+        state.initialize(layout, numGhosts)
+        single = BatchGameState.fromGameStates([state], seed)
+        batch = BatchGameState(layout, numStates, single.numAgents, seed)
+        batch.startX, batch.startY = single.startX, single.startY
+        for name in ['posX', 'posY', 'direction', 'scared', 'food', 'capsules',
+                     'numFood', 'score', 'win', 'lose']:
+            setattr(batch, name, np.repeat(getattr(single, name), numStates, 0))
+        return batch
+    fromLayout = staticmethod(fromLayout)
+
+    def fromGameStates(states, seed=None):
+        """
+        Returns a batch holding copies of the given GameStates, which must all
+        be on the same layout and have the same number of agents.
+        """
+        layout = states[0].data.layout
+        numAgents = states[0].getNumAgents()
+        batch = BatchGameState(layout, len(states), numAgents, seed)
+        height = layout.height
+        for agentIndex, agentState in enumerate(states[0].data.agentStates):
+            x, y = agentState.start.getPosition()
+            batch.startX[agentIndex] = int(x * 2)
+            batch.startY[agentIndex] = int(y * 2)
+        for n, state in enumerate(states):
+            data = state.data
+            for agentIndex, agentState in enumerate(data.agentStates):
+                configuration = agentState.configuration
+                batch.posX[n, agentIndex], batch.posY[n, agentIndex] = configuration.half
+                batch.direction[n, agentIndex] = configuration.directionCode
+                batch.scared[n, agentIndex] = agentState.scaredTimer
+            for x, y in data.food.asList():
+                batch.food[n, x * height + y] = True
+            for x, y in data.capsules:
+                batch.capsules[n, x * height + y] = True
+            batch.numFood[n] = state.getNumFood()
+            batch.score[n] = data.score
+            batch.win[n] = data._win
+            batch.lose[n] = data._lose
+        return batch
+    fromGameStates = staticmethod(fromGameStates)
+
+    def take(self, indices):
+        """
+        Returns a new batch holding copies of the given games, in that order;
+        an index may appear more than once.  The new batch continues this
+        batch's random stream.
+        """
+        indices = np.asarray(indices, np.int64)
+        batch = BatchGameState(self.tables.layout, len(indices), self.numAgents)
+        batch.startX, batch.startY = self.startX, self.startY
+        for name in ['posX', 'posY', 'direction', 'scared', 'food', 'capsules',
+                     'numFood', 'score', 'win', 'lose']:
+            setattr(batch, name, getattr(self, name)[indices])
+        batch.random = self.random
+        return batch
+
+    def isOver(self):
+        return self.win | self.lose
+
+    def getCells(self, agentIndex):
+        "Returns the cell index of the agent in every game (rounding half cells down)."
+        return (self.posX[:, agentIndex] // 2) * self.tables.height + self.posY[:, agentIndex] // 2
+
+    def getLegalPacmanMask(self):
+        """
+        Returns an (N, actions) boolean array of Pacman's legal actions, without
+        Stop, as getLegalPacmanActions would.  Rows of finished games are False.
+        """
+        legal = self.tables.pacmanLegal[self.getCells(0)].copy()
+        legal[:, STOP] = False
+        legal[self.isOver()] = False
+        return legal
+
+    def randomPacmanActions(self):
+        "Returns one uniformly random legal (non-Stop) action code per game."
+        legal = self.getLegalPacmanMask()
+        legal[self.isOver(), STOP] = True
+        return self._choose(legal, self.random.random_sample(self.numStates))
+
+    def _choose(self, legal, uniforms):
+        """
+        Picks, for every row of the boolean array legal, the k-th legal action
+        with k = floor(uniform * number of legal actions).  Rows without a
+        legal action get Stop.
+        """
+        counts = legal.sum(1)
+        k = np.minimum((uniforms * counts).astype(np.int64), np.maximum(counts - 1, 0))
+        chosen = (np.cumsum(legal, 1) > k[:, None]).argmax(1)
+        chosen[counts == 0] = STOP
+        return chosen
+
+    def step(self, pacmanActions, ghostUniforms=None):
+        """
+        Advances every unfinished game by one round: Pacman takes the given
+        action code and then each ghost, in order, replies with a uniformly
+        random legal action.  ghostUniforms, an optional (N, ghosts) array of
+        numbers in [0, 1), replaces the batch's own random draws.
+        """
+        pacmanActions = np.asarray(pacmanActions)
+        if ghostUniforms is None:
+            ghostUniforms = self.random.random_sample((self.numStates, self.numAgents - 1))
+        scoreChange = np.zeros(self.numStates, np.int64)
+
+        # Pacman moves a whole cell and then eats what is there
+        active = ~self.isOver()
+        legal = self.tables.pacmanLegal[self.getCells(0), pacmanActions]
+        if (active & ~legal).any():
+            raise Exception("Illegal action in batch games " + str(np.nonzero(active & ~legal)[0]))
+        moving = np.nonzero(active)[0]
+        actions = pacmanActions[moving]
+        self.posX[moving, 0] += 2 * DX[actions]
+        self.posY[moving, 0] += 2 * DY[actions]
+        turned = moving[actions != STOP]
+        self.direction[turned, 0] = pacmanActions[turned]
+        self._consume(moving, scoreChange)
+        scoreChange[moving] -= pacman.TIME_PENALTY
+        for ghostIndex in range(1, self.numAgents):
+            self._checkDeath(moving, ghostIndex, scoreChange)
+        self.score += scoreChange
+
+        for ghostIndex in range(1, self.numAgents):
+            scoreChange[:] = 0
+            moving = np.nonzero(~self.isOver())[0]
+            if len(moving) == 0: break
+            self._moveGhost(moving, ghostIndex, ghostUniforms[moving, ghostIndex - 1])
+            self._checkDeath(moving, ghostIndex, scoreChange)
+            self.score += scoreChange
+
+    def _consume(self, games, scoreChange):
+        cells = self.getCells(0)[games]
+        eating = self.food[games, cells]
+        eaters = games[eating]
+        self.food[eaters, cells[eating]] = False
+        self.numFood[eaters] -= 1
+        scoreChange[eaters] += 10
+        cleared = eaters[(self.numFood[eaters] == 0) & ~self.lose[eaters]]
+        scoreChange[cleared] += 500
+        self.win[cleared] = True
+
+        powered = self.capsules[games, cells]
+        poweredGames = games[powered]
+        self.capsules[poweredGames, cells[powered]] = False
+        self.scared[poweredGames, 1:] = pacman.SCARED_TIME
+
+    def _moveGhost(self, games, ghostIndex, uniforms):
+        x = self.posX[games, ghostIndex]
+        y = self.posY[games, ghostIndex]
+        direction = self.direction[games, ghostIndex]
+        # Between cells a ghost can only keep going
+        onCell = (x % 2 == 0) & (y % 2 == 0)
+        legal = self.tables.ghostLegal[self.getCells(ghostIndex)[games], direction]
+        legal[~onCell] = False
+        legal[np.nonzero(~onCell)[0], direction[~onCell]] = True
+        actions = self._choose(legal, uniforms)
+
+        timers = self.scared[games, ghostIndex]
+        speed = np.where(timers > 0, 1, 2)
+        x = x + DX[actions] * speed
+        y = y + DY[actions] * speed
+        self.direction[games, ghostIndex] = np.where(actions == STOP, direction, actions)
+
+        # A ghost whose fright ends snaps to the nearest cell
+        ending = timers == 1
+        x[ending] = (x[ending] + 1) // 2 * 2
+        y[ending] = (y[ending] + 1) // 2 * 2
+        self.posX[games, ghostIndex] = x
+        self.posY[games, ghostIndex] = y
+        self.scared[games, ghostIndex] = np.maximum(0, timers - 1)
+
+    def _checkDeath(self, games, ghostIndex, scoreChange):
+        distance = abs(self.posX[games, ghostIndex] - self.posX[games, 0]) + \
+            abs(self.posY[games, ghostIndex] - self.posY[games, 0])
+        touching = games[distance <= KILL_DISTANCE]
+        frightened = self.scared[touching, ghostIndex] > 0
+        eaten = touching[frightened]
+        scoreChange[eaten] += 200
+        self.posX[eaten, ghostIndex] = self.startX[ghostIndex]
+        self.posY[eaten, ghostIndex] = self.startY[ghostIndex]
+        self.direction[eaten, ghostIndex] = STOP
+        self.scared[eaten, ghostIndex] = 0
+        killers = touching[~frightened & ~self.win[touching]]
+        scoreChange[killers] -= 500
+        self.lose[killers] = True
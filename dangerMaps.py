@@ -0,0 +1,287 @@
+# dangerMaps.py
+# -------------
+# Per-layout Markov models of the ghosts and the danger maps built from them.
+
+"""
+A GhostModel is the Markov chain a ghost follows on a layout, over the
+states (cell, direction) of a ghost standing on a cell, cell = x * height + y
+as in BitGrid.  RandomGhost picks uniformly among its legal actions;
+DirectionalGhost moves towards Pacman with probability prob_attack, so its
+chain depends on Pacman's cell, which is taken to stay put.
+
+The probability that a ghost is on a cell after exactly k moves (its
+occupancy) comes from propagating its distribution through the chain.
+The probability that a ghost reaches a cell within k moves is a first
+passage probability: the ghost's distribution is propagated with the cell
+absorbing, and the mass absorbed by step k is the answer.  GhostModel does
+this for every cell at once (one row of the distribution per target cell),
+and getDangerMap combines the ghosts of a state, which move independently,
+into one map answering "how likely is a ghost on (x,y) within k moves" in
+constant time:
+
+  danger = dangerMaps.getDangerMap(state, 5)
+  if danger[x, y] < 0.1: ...
+
+getOccupancyMap does the same for the occupancy after exactly k moves.
+
+Only the cells a ghost can get to in k moves get a row.  Random ghost models
+are cached per layout and DirectionalGhost models, which depend on Pacman's
+cell, per layout and cell for the MAX_DIRECTIONAL_MODELS used last.  Each
+model keeps the propagations of the start states used last, extended step
+by step, up to MAX_CACHED_BYTES, so the same ghosts seen again on a later
+turn cost nothing.  Scared ghosts are modeled as ghosts moving a whole cell per step
+from the cell they are heading to.  This module needs NumPy; the rest of the
+game does not.
+"""
+
+import numpy as np
+from collections import OrderedDict
+from game import Actions
+from util import manhattanDistance
+from ghostAgents import DirectionalGhost
+
+NUM_ACTIONS = len(Actions._codeToAction)
+MAX_CACHED_BYTES = 16 * 2 ** 20 # propagations kept per model, least recently used dropped first
+MAX_DIRECTIONAL_MODELS = 4 # DirectionalGhost models kept, least recently used dropped first
+
+class GhostModel:
+    """
+    The transition probabilities of one ghost policy on a layout, stored as
+    the edge lists (source state, destination state, probability) of a
+    sparse matrix.  State s = cell * NUM_ACTIONS + direction code.
+    """
+    def __init__(self, layout, pacmanPosition=None, probAttack=0.8):
+        self.layout = layout
+        self.height = layout.height
+        self.numCells = layout.width * layout.height
+        sources, destinations, probabilities = [], [], []
+        for ((x, y), direction), actions in layout.ghostActions.items():
+            if len(actions) == 0: continue
+            code = Actions.actionToCode(direction)
+            cells = layout.neighborCells[(x, y)]
+            weights = [1.0 / len(actions)] * len(actions)
+            if pacmanPosition != None:
+                distances = [manhattanDistance(cells[Actions.actionToCode(a)], pacmanPosition) for a in actions]
+                best = [d == min(distances) for d in distances]
+                weights = [(1 - probAttack) / len(actions) + b * probAttack / sum(best) for b in best]
+            for action, weight in zip(actions, weights):
+                nx, ny = cells[Actions.actionToCode(action)]
+                sources.append((x * self.height + y) * NUM_ACTIONS + code)
+                destinations.append((nx * self.height + ny) * NUM_ACTIONS + Actions.actionToCode(action))
+                probabilities.append(weight)
+        self.sources = np.array(sources, np.int64)
+        self.destinations = np.array(destinations, np.int64)
+        self.probabilities = np.array(probabilities)
+        self._buildAbsorbingChains()
+        self._cache = OrderedDict()
+        self._cacheSizes = {}
+        self.cachedBytes = 0
+
+    def _buildAbsorbingChains(self):
+        """
+        Numbers the states the chain uses 0..n-1 and the cells they are on
+        0..t-1 (the targets), and sorts the edges by destination so that one
+        np.add.reduceat moves a whole (targets, states) matrix one step.
+        """
+        self.stateIds = np.unique(np.concatenate([self.sources, self.destinations]))
+        sources = np.searchsorted(self.stateIds, self.sources)
+        destinations = np.searchsorted(self.stateIds, self.destinations)
+        order = np.argsort(destinations, kind='mergesort')
+        self._edgeSources = sources[order]
+        self._edgeProbabilities = self.probabilities[order]
+        self._edgeDestinations, self._segmentStarts = np.unique(destinations[order], return_index=True)
+        stateCells = self.stateIds // NUM_ACTIONS
+        self.targetCells = np.unique(stateCells)
+        # Numbered state j is on target cell stateTargets[j]
+        self._stateTargets = np.searchsorted(self.targetCells, stateCells)
+
+    def step(self, distributions):
+        """
+        Returns the distributions (one row per target cell looked at, one
+        column per numbered state) one move after the given ones.
+        """
+        flow = distributions[:, self._edgeSources] * self._edgeProbabilities
+        stepped = np.zeros(distributions.shape)
+        stepped[:, self._edgeDestinations] = np.add.reduceat(flow, self._segmentStarts, axis=1)
+        return stepped
+
+    def getStartState(self, configuration):
+        """
+        Returns the model state of a ghost, or None off the layout's tables.
+        A ghost between two cells counts as standing on the one ahead of it.
+        """
+        if configuration.half == None or configuration.directionCode == None: return None
+        hx, hy = configuration.half
+        dx, dy = Actions._codeVectors[configuration.directionCode]
+        x = (hx + dx * (hx & 1)) >> 1
+        y = (hy + dy * (hy & 1)) >> 1
+        if (x, y) not in self.layout.neighborCells: return None
+        start = (x * self.height + y) * NUM_ACTIONS + configuration.directionCode
+        index = np.searchsorted(self.stateIds, start)
+        if index == len(self.stateIds) or self.stateIds[index] != start: return None
+        return start
+
+    def getReachProbabilities(self, start, k):
+        """
+        Returns, for every cell, the probability that a ghost in state start
+        is on it at some point in its next k moves, counting the cell it is
+        on now.
+        """
+        key = ('reach', start)
+        cached = self._recall(key)
+        if cached == None or cached[4] < k:
+            # Only the cells the ghost can get to in k moves need a row
+            cached = self._startPropagation(start, k)
+        distributions, reached, targets = cached[:3]
+        while len(reached) <= k:
+            cached[0] = distributions = self.step(distributions)
+            self._absorb(cached)
+        self._remember(key, cached, distributions.nbytes + len(reached) * reached[0].nbytes)
+        reach = np.zeros(self.numCells)
+        reach[self.targetCells[targets]] = reached[k]
+        return reach
+
+    def getOccupancy(self, start, k):
+        """
+        Returns, for every cell, the probability that a ghost in state start
+        is on it after exactly k moves.
+        """
+        key = ('occupancy', start)
+        distributions = self._recall(key)
+        if distributions == None:
+            first = np.zeros((1, len(self.stateIds)))
+            first[0, np.searchsorted(self.stateIds, start)] = 1.0
+            distributions = [first]
+        while len(distributions) <= k:
+            distributions.append(self.step(distributions[-1]))
+        self._remember(key, distributions, len(distributions) * distributions[0].nbytes)
+        occupancy = np.zeros(self.numCells)
+        occupancy[self.targetCells] = np.bincount(self._stateTargets, distributions[k][0],
+                                                  len(self.targetCells))
+        return occupancy
+
+    def _recall(self, key):
+        "Returns the cached propagation under key, now the most recently used, or None."
+        cached = self._cache.pop(key, None)
+        if cached != None: self._cache[key] = cached
+        return cached
+
+    def _remember(self, key, cached, size):
+        """
+        Caches a propagation of size bytes under key, dropping the least
+        recently used others while the cache is over MAX_CACHED_BYTES.
+        """
+        self.cachedBytes += size - self._cacheSizes.get(key, 0)
+        self._cacheSizes[key] = size
+        self._cache.pop(key, None)
+        self._cache[key] = cached
+        while self.cachedBytes > MAX_CACHED_BYTES and len(self._cache) > 1:
+            oldKey, old = self._cache.popitem(last=False)
+            self.cachedBytes -= self._cacheSizes.pop(oldKey)
+
+    def _startPropagation(self, start, k):
+        """
+        Returns [distributions, reached so far, target rows, absorbed states,
+        k] for a ghost in state start, one row per cell it can get to in k
+        moves, before any move.
+        """
+        first = np.searchsorted(self.stateIds, start)
+        reachable = np.zeros(len(self.stateIds), bool)
+        reachable[first] = True
+        for move in range(k):
+            reachable[self._edgeDestinations[np.add.reduceat(reachable[self._edgeSources].astype(int),
+                                                             self._segmentStarts) > 0]] = True
+        targets = np.unique(self._stateTargets[reachable])
+        rows = np.zeros(len(self.targetCells), int) - 1
+        rows[targets] = np.arange(len(targets))
+        states = np.nonzero(rows[self._stateTargets] >= 0)[0]
+        absorbed = (rows[self._stateTargets[states]], states)
+        distributions = np.zeros((len(targets), len(self.stateIds)))
+        distributions[:, first] = 1.0
+        cached = [distributions, [], targets, absorbed, k]
+        self._absorb(cached)
+        return cached
+
+    def _absorb(self, cached):
+        "Moves the mass that has reached its target cell out of the distributions."
+        distributions, reached, targets, absorbed = cached[:4]
+        arrived = np.bincount(absorbed[0], distributions[absorbed], len(targets))
+        distributions[absorbed] = 0
+        if reached: arrived += reached[-1]
+        reached.append(arrived)
+
+_MODELS = {}
+_DIRECTIONAL_MODELS = OrderedDict()
+
+def getGhostModel(layout, ghostAgent=None, pacmanPosition=None):
+    """
+    Returns the cached model of ghostAgent on layout: a DirectionalGhost
+    chasing Pacman at pacmanPosition, or a random ghost for anything else.
+    """
+    if isinstance(ghostAgent, DirectionalGhost) and pacmanPosition != None:
+        pacmanPosition = (int(pacmanPosition[0] + 0.5), int(pacmanPosition[1] + 0.5))
+        key = (layout, pacmanPosition, ghostAgent.prob_attack)
+        model = _DIRECTIONAL_MODELS.pop(key, None)
+        if model == None:
+            model = GhostModel(layout, pacmanPosition, ghostAgent.prob_attack)
+            if len(_DIRECTIONAL_MODELS) >= MAX_DIRECTIONAL_MODELS: _DIRECTIONAL_MODELS.popitem(last=False)
+        _DIRECTIONAL_MODELS[key] = model
+        return model
+    if layout not in _MODELS:
+        _MODELS[layout] = GhostModel(layout)
+    return _MODELS[layout]
+
+class DangerMap:
+    """
+    A probability for every cell, as a (width, height) array: of meeting a
+    ghost there within some number of moves (getDangerMap), or of a ghost
+    being there after exactly that many (getOccupancyMap).  danger[x, y] and
+    getDanger(x, y) look it up.
+    """
+    def __init__(self, probabilities):
+        self.probabilities = probabilities
+
+    def getDanger(self, x, y):
+        return self.probabilities[x, y]
+
+    def __getitem__(self, position):
+        return self.probabilities[position]
+
+def getDangerMap(state, k, ghostAgents=None):
+    """
+    Returns the DangerMap of the ghosts of a GameState over their next k moves:
+    the probability that at least one of them reaches each cell.
+    ghostAgents[i-1], if given, is the agent playing ghost i.  A ghost that
+    stays scared for all k moves is no danger and is left out.
+    """
+    layout = state.data.layout
+    safe = np.ones(layout.width * layout.height)
+    pacmanPosition = state.getPacmanPosition()
+    for index in range(1, state.getNumAgents()):
+        ghostState = state.data.agentStates[index]
+        if ghostState.scaredTimer > k: continue
+        agent = None
+        if ghostAgents != None: agent = ghostAgents[index - 1]
+        model = getGhostModel(layout, agent, pacmanPosition)
+        start = model.getStartState(ghostState.configuration)
+        if start == None: continue
+        safe *= 1 - model.getReachProbabilities(start, k)
+    return DangerMap((1 - safe).reshape(layout.width, layout.height))
+
+def getOccupancyMap(state, k, ghostAgents=None):
+    """
+    Returns the occupancy of the ghosts of a GameState after exactly k moves
+    as a DangerMap: the probability that at least one of them is on each
+    cell.  ghostAgents is as for getDangerMap; scared ghosts are counted.
+    """
+    layout = state.data.layout
+    empty = np.ones(layout.width * layout.height)
+    pacmanPosition = state.getPacmanPosition()
+    for index in range(1, state.getNumAgents()):
+        agent = None
+        if ghostAgents != None: agent = ghostAgents[index - 1]
+        model = getGhostModel(layout, agent, pacmanPosition)
+        start = model.getStartState(state.data.agentStates[index].configuration)
+        if start == None: continue
+        empty *= 1 - model.getOccupancy(start, k)
+    return DangerMap((1 - empty).reshape(layout.width, layout.height))
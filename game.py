@@ -22,6 +22,7 @@
 
 from util import *
 import time, os
+from array import array
 import traceback
 import sys
 
@@ -67,18 +68,52 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+CONFIGURATION_CACHE = {}
+
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
-    """
 
-    def __init__(self, pos, direction):
-        self.pos = pos
-        self.direction = direction
+    Configurations are immutable and interned: Configuration(pos, direction)
+    returns the one shared instance for that position and direction, so a
+    search tree holds a single object per distinct configuration.
+
+    half is the position in integer half-cell units, (2x, 2y), or None when
+    the position is not a multiple of half a cell.  The fixed-point engine in
+    pacman.py works on it instead of the float position.  directionCode is
+    the integer code of direction (see Actions.actionToCode).
+    """
+    __slots__ = ('pos', 'direction', 'directionCode', 'half', '_hash', '_successors', '_moves')
+
+    def __new__(cls, pos, direction):
+        # Keep int and float positions apart so that getPosition() returns the
+        # same types as before
+        key = (pos, direction, type(pos[0]))
+        conf = CONFIGURATION_CACHE.get(key)
+        if conf is None:
+            conf = object.__new__(cls)
+            object.__setattr__(conf, 'pos', pos)
+            object.__setattr__(conf, 'direction', direction)
+            object.__setattr__(conf, 'directionCode', Actions._actionToCode.get(direction))
+            x, y = pos
+            half = (int(x * 2), int(y * 2))
+            if half[0] != x * 2 or half[1] != y * 2: half = None
+            object.__setattr__(conf, 'half', half)
+            object.__setattr__(conf, '_hash', hash(hash(pos) + 13 * hash(direction)))
+            object.__setattr__(conf, '_successors', {})
+            object.__setattr__(conf, '_moves', {})
+            CONFIGURATION_CACHE[key] = conf
+        return conf
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configurations are immutable')
+
+    def __reduce__(self):
+        return (Configuration, (self.pos, self.direction))
 
     def getPosition(self):
         return (self.pos)
@@ -87,17 +122,24 @@ class Configuration:
         return self.direction
 
     def isInteger(self):
+        if self.half != None:
+            return self.half[0] & 1 == 0 and self.half[1] & 1 == 0
         x,y = self.pos
         return x == int(x) and y == int(y)
 
+    def copy(self):
+        return self
+
     def __eq__(self, other):
-        if other == None: return False
+        if self is other: return True
+        if other is None: return False
         return (self.pos == other.pos and self.direction == other.direction)
 
+    def __ne__(self, other):
+        return not self == other
+
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        return self._hash
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -110,17 +152,38 @@ class Configuration:
 
         Actions are movement vectors.
         """
-        x, y= self.pos
-        dx, dy = vector
-        direction = Actions.vectorToDirection(vector)
-        if direction == Directions.STOP:
-            direction = self.direction # There is no stop direction
-        return Configuration((x + dx, y+dy), direction)
-
-class AgentState:
+        successor = self._successors.get(vector)
+        if successor is None:
+            x, y= self.pos
+            dx, dy = vector
+            direction = Actions.vectorToDirection(vector)
+            if direction == Directions.STOP:
+                direction = self.direction # There is no stop direction
+            successor = self._successors[vector] = Configuration((x + dx, y+dy), direction)
+        return successor
+
+    def getSuccessor(self, action, speed):
+        """
+        Returns generateSuccessor(Actions.directionToVector(action, speed)),
+        looked up in a per-configuration table after the first call.  The
+        action may be given as a string or as an integer code.
+        """
+        key = (Actions._actionToCode.get(action, action), speed)
+        successor = self._moves.get(key)
+        if successor is None:
+            dx, dy = Actions._codeVectors[key[0]]
+            successor = self.generateSuccessor((dx * speed, dy * speed))
+            self._moves[key] = successor
+        return successor
+
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
+
+    Within a game state, AgentStates are only changed through the
+    GameStateData setters, which copy them first if they are shared.
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -130,6 +193,14 @@ class AgentState:
         self.numCarrying = 0
         self.numReturned = 0
 
+    def __getstate__( self ):
+        return (self.start, self.configuration, self.isPacman, self.scaredTimer,
+                self.numCarrying, self.numReturned)
+
+    def __setstate__( self, state ):
+        (self.start, self.configuration, self.isPacman, self.scaredTimer,
+         self.numCarrying, self.numReturned) = state
+
     def __str__( self ):
         if self.isPacman:
             return "Pacman: " + str( self.configuration )
@@ -137,16 +208,21 @@ class AgentState:
             return "Ghost: " + str( self.configuration )
 
     def __eq__( self, other ):
-        if other == None:
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
+    def __ne__( self, other ):
+        return not self == other
+
     def __hash__(self):
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
+        state = object.__new__( AgentState )
+        state.start = self.start
         state.configuration = self.configuration
+        state.isPacman = self.isPacman
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
         state.numReturned = self.numReturned
@@ -167,9 +243,10 @@ class Grid:
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
+    CELLS_PER_INT = 30
+
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
-        self.CELLS_PER_INT = 30
 
         self.width = width
         self.height = height
@@ -190,6 +267,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if isinstance(other, BitGrid): return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -205,7 +283,7 @@ class Grid:
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.data = [list(x) for x in self.data]
         return g
 
     def deepCopy(self):
@@ -216,6 +294,13 @@ class Grid:
         g.data = self.data
         return g
 
+    def freeze(self):
+        """
+        Makes the grid read-only: columns become tuples, so grid[x][y] = value
+        raises a TypeError.  Copies of a frozen grid are writable again.
+        """
+        self.data = [tuple(x) for x in self.data]
+
     def count(self, item =True ):
         return sum([x.count(item) for x in self.data])
 
@@ -232,18 +317,8 @@ class Grid:
 
         (width, height, bitPackedInts...)
         """
-        bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
-        return tuple(bits)
+        cells = ''.join([cell and '1' or '0' for column in self.data for cell in column])
+        return packCells(self.width, self.height, cells, self.CELLS_PER_INT)
 
     def _cellIndexToPosition(self, index):
         x = index / self.height
@@ -274,6 +349,131 @@ class Grid:
                 bools.append(False)
         return bools
 
+class BitGrid:
+    """
+    A boolean Grid backed by a single integer bitboard, where cell (x,y) is
+    bit x * height + y.  Cells are read with the same grid[x][y] notation as
+    a Grid, but copying is O(1) and count() is a cached popcount that is
+    updated incrementally whenever a cell changes.
+    """
+    def __init__(self, width, height, bits=0, numSet=None):
+        self.width = width
+        self.height = height
+        self.bits = bits
+        if numSet == None: numSet = bin(bits).count('1')
+        self.numSet = numSet
+
+    def fromGrid(grid):
+        bits = 0
+        for x, y in grid.asList():
+            bits |= 1 << (x * grid.height + y)
+        return BitGrid(grid.width, grid.height, bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def __getitem__(self, x):
+        if x < 0 or x >= self.width: raise IndexError(x)
+        return _BitColumn(self, x)
+
+    def getCell(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def setCell(self, x, y, value):
+        mask = 1 << (x * self.height + y)
+        if value:
+            if not self.bits & mask:
+                self.bits |= mask
+                self.numSet += 1
+        elif self.bits & mask:
+            self.bits ^= mask
+            self.numSet -= 1
+
+    def __str__(self):
+        out = [[str(self.getCell(x, y))[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height
+        return self.width == other.width and self.height == other.height and \
+            self.asList() == other.asList()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        return BitGrid(self.width, self.height, self.bits, self.numSet)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        if item: return self.numSet
+        return self.width * self.height - self.numSet
+
+    def asList(self, key=True):
+        list = []
+        bits = self.bits
+        if not key: bits ^= (1 << (self.width * self.height)) - 1
+        while bits:
+            low = bits & -bits
+            list.append(divmod(low.bit_length() - 1, self.height))
+            bits ^= low
+        return list
+
+    def packBits(self):
+        """
+        Returns the same packed representation as Grid.packBits, straight from
+        the bits.
+        """
+        numCells = self.width * self.height
+        cells = bin(self.bits)[2:].zfill(numCells)[::-1]
+        return packCells(self.width, self.height, cells, Grid.CELLS_PER_INT)
+
+    def toGrid(self):
+        g = Grid(self.width, self.height)
+        for x, y in self.asList():
+            g[x][y] = True
+        return g
+
+class _BitColumn:
+    "A view of one column of a BitGrid, so that grid[x][y] reads and writes work."
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        grid = self.grid
+        return (grid.bits >> (self.x * grid.height + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        self.grid.setCell(self.x, y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        return iter([self[y] for y in range(self.grid.height)])
+
+def packCells(width, height, cells, cellsPerInt):
+    """
+    Packs a string of '0' and '1' cell values, in cell index order, into
+    (width, height, bitPackedInts...) as Grid.packBits describes it: the
+    first cell of every int is its highest bit, and there is always a last,
+    possibly empty, int.
+    """
+    bits = [width, height]
+    for start in range(0, len(cells) + 1, cellsPerInt):
+        bits.append(int(cells[start:start + cellsPerInt].ljust(cellsPerInt, '0'), 2))
+    return tuple(bits)
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -297,8 +497,28 @@ class Actions:
 
     _directionsAsList = _directions.items()
 
+    # Integer action codes used inside the game engine: code i is the i-th
+    # action of _directionsAsList, so lists of codes come out in the same
+    # order as lists of actions.  Agents and displays only ever see strings.
+    _codeToAction = tuple([direction for direction, vector in _directionsAsList])
+    _actionToCode = dict([(direction, code) for code, direction in enumerate(_codeToAction)])
+    _codeVectors = tuple([vector for direction, vector in _directionsAsList])
+    STOP_CODE = _actionToCode[Directions.STOP]
+
     TOLERANCE = .001
 
+    def actionToCode(action):
+        """
+        Returns the integer code of an action.  Codes are returned unchanged, and
+        so is anything that is not an action, for the rules to reject.
+        """
+        return Actions._actionToCode.get(action, action)
+    actionToCode = staticmethod(actionToCode)
+
+    def codeToAction(code):
+        return Actions._codeToAction[code]
+    codeToAction = staticmethod(codeToAction)
+
     def reverseDirection(action):
         if action == Directions.NORTH:
             return Directions.SOUTH
@@ -368,33 +588,113 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+ZOBRIST_MASK = (1 << 64) - 1
+ZOBRIST_CACHE = {}
+
+class Zobrist:
+    """
+    64-bit Zobrist keys for the parts of a game state.  The key of a state is
+    the XOR of the keys of its agents, scared timers, food, capsules and
+    score, so a rule that changes one of them can update the key in O(1).
+
+    Keys are derived from the component itself with a fixed mixing function
+    rather than drawn at random, so they are the same on every run.
+    """
+    _DIRECTION_CODES = {Directions.NORTH: 0, Directions.SOUTH: 1, Directions.EAST: 2,
+                        Directions.WEST: 3, Directions.STOP: 4}
+
+    def mix(value):
+        "Scrambles an integer into a 64-bit key (the splitmix64 finalizer)."
+        z = (value + 0x9E3779B97F4A7C15) & ZOBRIST_MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & ZOBRIST_MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & ZOBRIST_MASK
+        return z ^ (z >> 31)
+    mix = staticmethod(mix)
+
+    def agentKey(index, configuration):
+        if configuration == None: return 0
+        cacheKey = (index, configuration)
+        key = ZOBRIST_CACHE.get(cacheKey)
+        if key == None:
+            x, y = configuration.pos
+            code = (1 << 60) | (index << 40) | (int(x * 2) << 24) | (int(y * 2) << 8) | \
+                Zobrist._DIRECTION_CODES.get(configuration.direction, 5)
+            key = ZOBRIST_CACHE[cacheKey] = Zobrist.mix(code)
+        return key
+    agentKey = staticmethod(agentKey)
+
+    def scaredKey(index, timer):
+        return Zobrist.mix((2 << 60) | (index << 40) | timer)
+    scaredKey = staticmethod(scaredKey)
+
+    def foodKey(x, y):
+        return Zobrist.mix((3 << 60) | (x << 20) | y)
+    foodKey = staticmethod(foodKey)
+
+    def capsuleKey(position):
+        x, y = position
+        return Zobrist.mix((4 << 60) | (x << 20) | y)
+    capsuleKey = staticmethod(capsuleKey)
+
+    def scoreKey(score):
+        return Zobrist.mix((5 << 60) ^ (hash(score) & ZOBRIST_MASK))
+    scoreKey = staticmethod(scoreKey)
+
+# Kinds of GameStateData journal entries
+MOVED, SCARED, ATE_FOOD, ATE_CAPSULE = range( 4 )
+
 class GameStateData:
     """
 
     """
+    # Store food in a BitGrid (O(1) copies, cached count) rather than a Grid
+    BITBOARD_FOOD = True
+    # Number of data packets initialized so far, for allocation statistics
+    created = 0
+    # While a list, moveAgent, setScaredTimer, removeFood and removeCapsule
+    # append the value they overwrite to it, so rollBack can restore them
+    _journal = None
+
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
         """
+        GameStateData.created += 1
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            # Food, capsules and agent states are shared with the predecessor
+            # until a rule asks for a mutable copy (see getMutableAgentState)
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._zobrist = prevState._zobrist
+            prevState.releaseOwnership()
+        else:
+            self._zobrist = None
+        self.releaseOwnership()
+        self.resetMoveInfo()
+        self._lose = False
+        self._win = False
 
+    def resetMoveInfo( self ):
+        """
+        Clears the record of what the last move changed, before another move
+        is applied to the same data.
+        """
         self._foodEaten = None
         self._foodAdded = None
         self._capsuleEaten = None
         self._agentMoved = None
-        self._lose = False
-        self._win = False
         self.scoreChange = 0
 
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state.takeOwnership()
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -408,12 +708,132 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def releaseOwnership( self ):
+        """
+        Marks food, capsules and agent states as shared, so the next change to
+        any of them through the getMutable* methods copies it first.
+        """
+        self._ownsFood = False
+        self._ownsCapsules = False
+        self._ownedAgents = None
+
+    def takeOwnership( self ):
+        """
+        Marks food, capsules and agent states as private to this state, so the
+        getMutable* methods change them in place.
+        """
+        self._ownsFood = True
+        self._ownsCapsules = True
+        self._ownedAgents = [True for a in self.agentStates]
+
+    def getMutableAgentState( self, index ):
+        """
+        Returns the AgentState of the given agent, copying it (and the list
+        holding it) first if it is still shared with another state.
+        """
+        owned = self._ownedAgents
+        if owned == None:
+            self.agentStates = self.agentStates[:]
+            owned = self._ownedAgents = [False for a in self.agentStates]
+        if not owned[index]:
+            self.agentStates[index] = self.agentStates[index].copy()
+            owned[index] = True
+        return self.agentStates[index]
+
+    def moveAgent( self, index, configuration ):
+        "Sets the configuration of an agent, keeping the Zobrist key in step."
+        agentState = self.getMutableAgentState( index )
+        if self._journal != None:
+            self._journal.append( (MOVED, index, agentState.configuration) )
+        if self._zobrist != None:
+            self._zobrist ^= Zobrist.agentKey( index, agentState.configuration ) ^ \
+                Zobrist.agentKey( index, configuration )
+        agentState.configuration = configuration
+
+    def setScaredTimer( self, index, timer ):
+        agentState = self.agentStates[index]
+        if agentState.scaredTimer == timer: return
+        if self._journal != None:
+            self._journal.append( (SCARED, index, agentState.scaredTimer) )
+        if self._zobrist != None:
+            self._zobrist ^= Zobrist.scaredKey( index, agentState.scaredTimer ) ^ \
+                Zobrist.scaredKey( index, timer )
+        self.getMutableAgentState( index ).scaredTimer = timer
+
+    def removeFood( self, x, y ):
+        self.getMutableFood()[x][y] = False
+        if self._journal != None:
+            self._journal.append( (ATE_FOOD, x, y) )
+        if self._zobrist != None:
+            self._zobrist ^= Zobrist.foodKey( x, y )
+
+    def removeCapsule( self, position ):
+        capsules = self.getMutableCapsules()
+        if self._journal != None:
+            self._journal.append( (ATE_CAPSULE, capsules.index( position ), position) )
+        capsules.remove( position )
+        if self._zobrist != None:
+            self._zobrist ^= Zobrist.capsuleKey( position )
+
+    def rollBack( self, mark ):
+        """
+        Undoes the journaled changes made since the journal had length mark,
+        newest first.  The Zobrist key is not touched; callers restore it.
+        Writes go through the getMutable* methods, so states that share the
+        containers keep their contents.
+        """
+        journal = self._journal
+        while len( journal ) > mark:
+            kind, a, b = journal.pop()
+            if kind == MOVED:
+                self.getMutableAgentState( a ).configuration = b
+            elif kind == SCARED:
+                self.getMutableAgentState( a ).scaredTimer = b
+            elif kind == ATE_FOOD:
+                self.getMutableFood()[a][b] = True
+            else:
+                self.getMutableCapsules().insert( a, b )
+
+    def getZobristKey( self ):
+        """
+        Returns a 64-bit key for the state.  Equal states have equal keys; the
+        part covering agents, food and capsules is maintained incrementally by
+        moveAgent, setScaredTimer, removeFood and removeCapsule.
+        """
+        if self._zobrist == None:
+            self._zobrist = self._computeZobrist()
+        return self._zobrist ^ Zobrist.scoreKey( self.score )
+
+    def _computeZobrist( self ):
+        key = 0
+        for index, agentState in enumerate( self.agentStates ):
+            key ^= Zobrist.agentKey( index, agentState.configuration )
+            key ^= Zobrist.scaredKey( index, agentState.scaredTimer )
+        for x, y in self.food.asList():
+            key ^= Zobrist.foodKey( x, y )
+        for position in self.capsules:
+            key ^= Zobrist.capsuleKey( position )
+        return key
+
+    def getMutableFood( self ):
+        if not self._ownsFood:
+            self.food = self.food.copy()
+            self._ownsFood = True
+        return self.food
+
+    def getMutableCapsules( self ):
+        if not self._ownsCapsules:
+            self.capsules = self.capsules[:]
+            self._ownsCapsules = True
+        return self.capsules
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
         """
         if other == None: return False
         # TODO Check for type of other
+        if self.getZobristKey() != other.getZobristKey(): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -424,13 +844,7 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return self.getZobristKey()
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -488,9 +902,12 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        if GameStateData.BITBOARD_FOOD:
+            self.food = BitGrid.fromGrid(layout.food)
+        else:
+            self.food = layout.food.copy()
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list(layout.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -503,6 +920,40 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self.takeOwnership()
+        self._zobrist = self._computeZobrist()
+
+class MoveHistory:
+    """
+    The moves of a game as two byte arrays, agent indices and action codes.
+    It reads like the list of (agentIndex, action) pairs it replaces, with
+    actions given back as strings; anything that is not an action is kept
+    as None.
+    """
+    def __init__(self, moves=()):
+        self.agents = array('B')
+        self.actions = array('b')
+        for move in moves:
+            self.append(move)
+
+    def append(self, move):
+        agentIndex, action = move
+        code = Actions.actionToCode(action)
+        if type(code) is not int: code = -1
+        self.agents.append(agentIndex)
+        self.actions.append(code)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __getitem__(self, i):
+        code = self.actions[i]
+        if code < 0: return (self.agents[i], None)
+        return (self.agents[i], Actions._codeToAction[code])
+
+    def __iter__(self):
+        for i in range(len(self.actions)):
+            yield self[i]
 
 try:
     import boinc
@@ -530,7 +981,7 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
-        self.moveHistory = []
+        self.moveHistory = MoveHistory()
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
@@ -596,7 +1047,7 @@ class Game:
                         timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            timed_func(self.state.makeObservation())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -610,7 +1061,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self.state.makeObservation())
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -624,7 +1075,7 @@ class Game:
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            observation = self.state.deepCopy()
+            observation = self.state.makeObservation()
 
             # Solicit an action
             action = None
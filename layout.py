@@ -14,14 +14,24 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import Actions
+from game import Configuration
+from game import Directions
 import os
 import random
+import hashlib
 
 VISIBILITY_MATRIX_CACHE = {}
+LAYOUT_CACHE = {}
+LAYOUT_HASHES = {}
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are immutable once built: the walls and food grids are frozen and
+    the capsule and agent lists are tuples.  Game states only reference their
+    layout, so use internLayout to share one Layout per layout text.
     """
 
     def __init__(self, layoutText):
@@ -33,10 +43,82 @@ class Layout:
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
-        self.layoutText = layoutText
+        self.layoutText = tuple(layoutText)
+        self.layoutHash = hashLayoutText(self.layoutText)
+        LAYOUT_HASHES.setdefault(self.layoutHash, self)
         self.totalFood = len(self.food.asList())
+        self.walls.freeze()
+        self.food.freeze()
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
+        self.buildMoveTables()
+        self.mazeDistances = {}
         # self.initializeVisibilityMatrix()
 
+    def buildMoveTables(self):
+        """
+        Precomputes the moves available on every open cell so the game rules
+        do not have to look at the walls on every move:
+
+          legalActions[(x,y)]             the actions of an agent standing on (x,y)
+          ghostActions[((x,y), direction)] the actions of a ghost on (x,y) that
+                                          arrived travelling in direction
+          legalCodes, ghostCodes          the same with integer action codes,
+                                          keyed by ((x,y), direction code) for ghosts
+          neighborCells[(x,y)]            the cell one step away along each
+                                          action code, None through a wall
+
+        Actions are listed in the same order as Actions.getPossibleActions.
+        """
+        self.legalActions = {}
+        self.ghostActions = {}
+        self.legalCodes = {}
+        self.ghostCodes = {}
+        self.neighborCells = {}
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x][y]: continue
+                try:
+                    possible = Actions.getPossibleActions(Configuration((x, y), Directions.STOP), self.walls)
+                except IndexError:
+                    continue # An open cell on the border: leave it to the slow path
+                self.legalActions[(x, y)] = tuple(possible)
+                self.legalCodes[(x, y)] = tuple([Actions.actionToCode(a) for a in possible])
+                cells = [None] * len(Actions._codeToAction)
+                for action in possible:
+                    dx, dy = Actions._directions[action]
+                    cells[Actions.actionToCode(action)] = (x + dx, y + dy)
+                self.neighborCells[(x, y)] = tuple(cells)
+                for direction in Actions._directions:
+                    ghostPossible = [a for a in possible if a != Directions.STOP]
+                    reverse = Actions.reverseDirection(direction)
+                    if reverse in ghostPossible and len(ghostPossible) > 1:
+                        ghostPossible.remove(reverse)
+                    self.ghostActions[((x, y), direction)] = tuple(ghostPossible)
+                    self.ghostCodes[((x, y), Actions.actionToCode(direction))] = \
+                        tuple([Actions.actionToCode(a) for a in ghostPossible])
+
+    def getMazeDistances(self, position):
+        """
+        Returns a dict from every cell reachable from position to its maze
+        distance, found by breadth first search over the move tables and
+        cached per position.
+        """
+        distances = self.mazeDistances.get(position)
+        if distances == None:
+            distances = {position: 0}
+            frontier = [position]
+            while frontier:
+                nextFrontier = []
+                for cell in frontier:
+                    for next in self.neighborCells.get(cell, ()):
+                        if next != None and next not in distances:
+                            distances[next] = distances[cell] + 1
+                            nextFrontier.append(next)
+                frontier = nextFrontier
+            self.mazeDistances[position] = distances
+        return distances
+
     def getNumGhosts(self):
         return self.numGhosts
 
@@ -90,7 +172,8 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, so copies can share the original
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -145,5 +228,28 @@ def getLayout(name, back = 2):
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return internLayout([line.strip() for line in f])
     finally: f.close()
+
+def hashLayoutText(layoutText):
+    "Returns a 64-bit hash of a layout's text that is the same on every run."
+    digest = hashlib.md5('\n'.join(layoutText)).hexdigest()
+    return int(digest[:16], 16)
+
+def getLayoutByHash(layoutHash):
+    """
+    Returns a Layout built in this process whose layoutHash is the given one,
+    or None if there is none.
+    """
+    return LAYOUT_HASHES.get(layoutHash)
+
+def internLayout(layoutText):
+    """
+    Returns the shared Layout for the given layout text, building it the
+    first time that text is seen.
+    """
+    key = tuple(layoutText)
+    if key not in LAYOUT_CACHE:
+        LAYOUT_CACHE[key] = Layout(key)
+    return LAYOUT_CACHE[key]
+
@@ -44,6 +44,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import Zobrist
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -68,6 +70,13 @@ class GameState:
     Note that in classic Pacman, Pacman is always agent 0.
     """
 
+    # Moves each ghost skipped by approximate successors (see _freezeGhosts)
+    _drift = None
+    # The common random numbers the ghosts draw from, if any, and the number of
+    # rounds played since they were attached (see withCommonRandomNumbers)
+    _crn = None
+    _ply = 0
+
     ####################################################
     # Accessor methods: use these to access state data #
     ####################################################
@@ -83,35 +92,20 @@ class GameState:
         else:
             return GhostRules.getLegalActions( self, agentIndex )
 
-    def generateSuccessor(self, agentIndex, action):
+    def generateSuccessor(self, agentIndex, action, trusted=False):
         """
-        Returns the successor state after the specified agent takes the action.
+        Returns the successor state after the specified agent takes the action,
+        given as a string or as an integer code (see Actions.actionToCode).
+
+        Pass trusted=True only for an action taken from getLegalActions of this
+        state; the rules then skip checking that it is legal.
         """
         # Check that successors exist
         if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
 
         # Copy current state
         state = GameState(self)
-
-        # Let agent's logic deal with its action's effects on the board
-        if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
-            PacmanRules.applyAction( state, action )
-        else:                # A ghost is moving
-            GhostRules.applyAction( state, action, agentIndex )
-
-        # Time passes
-        if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
-        else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
-
-        # Resolve multi-agent effects
-        GhostRules.checkDeath( state, agentIndex )
-
-        # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
+        state._applyMove( agentIndex, action, trusted )
         return state
 
     def getLegalPacmanActions( self ):
@@ -119,23 +113,176 @@ class GameState:
         if Directions.STOP in actions: actions.remove(Directions.STOP)
         return actions
 
-    def generatePacmanSuccessor( self, action ):
+    def generatePacmanSuccessor( self, action, trusted=False, horizon=None ):
+        """
+        Generates the successor state after the specified pacman move and one
+        random reply from every ghost.  All moves of the round are applied to a
+        single new state rather than one intermediate state per ghost.
+
+        As with generateSuccessor, trusted=True skips the legality check of an
+        action taken from getLegalPacmanActions.
+
+        Rollouts that look only horizon more rounds ahead (counting this one)
+        may pass horizon to skip the ghosts that are too far away, by maze
+        distance, to reach Pacman in that time: they stay where they are,
+        though their scared timers still run down.  The result is
+        approximate; see isApproximate and approximationMayMatter.
+        """
+        Game.currentIterations -= 1
+        if Game.currentIterations <= 0:
+            return None
+        if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+
+        state = GameState(self)
+        state._applyRound( action, trusted, horizon )
+        return state
+
+    def generateLazyPacmanSuccessor( self, action, trusted=False, horizon=None ):
+        """
+        Like generatePacmanSuccessor, but returns a LazyGameState: Pacman's move
+        is applied now and the ghosts' replies only when the state is looked at
+        beyond Pacman, the food and the score.  The ghosts' random choices are
+        drawn now, so the game plays out exactly as with generatePacmanSuccessor.
+        """
         Game.currentIterations -= 1
         if Game.currentIterations <= 0:
             return None
+        if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+
+        return self._lazyRound( action, trusted, horizon )
+
+    def withCommonRandomNumbers( self, seed ):
         """
-        Generates the successor state after the specified pacman move
+        Returns a copy of this state whose successors draw the ghosts' replies
+        from CommonRandomNumbers(seed) instead of the random module.  Draws are
+        keyed by the round since this state and the ghost, so every sequence of
+        pacman moves from here meets the same ghost luck, and candidate moves
+        can be compared with far less noise.
         """
-        newState = self.generateSuccessor(0, action)
-        for i in range(1,self.getNumAgents()):
-            actions = newState.getLegalActions(i)
-            if newState.isWin() or newState.isLose():
-                break;
-            if len(actions) > 0:
-                newState = newState.generateSuccessor(i, actions[random.randint(0, len(actions) - 1)])
-            else:
-                newState = newState.generateSuccessor(i, Directions.STOP)
-        return newState
+        state = self.makeObservation()
+        state._crn = CommonRandomNumbers( seed )
+        state._ply = 0
+        return state
+
+    def getRandomContext( self ):
+        """
+        Returns the CommonRandomNumbers the ghosts of this state's successors
+        draw from and the round they are at, or (None, 0) for the random module.
+        """
+        return self._crn, self._ply
+
+    def isApproximate( self ):
+        """
+        Returns whether some ghost was held still, by a horizon passed to
+        generatePacmanSuccessor, on the way to this state.
+        """
+        return self._drift != None and max( self._drift ) > 0
+
+    def approximationMayMatter( self ):
+        """
+        Returns whether a ghost that was held still is close enough to Pacman
+        that, had it moved, it might have caught or been eaten by him already.
+        """
+        if not self.isApproximate(): return False
+        distances = self.data.layout.getMazeDistances( nearestPoint( self.getPacmanPosition() ) )
+        for index in range( 1, self.getNumAgents() ):
+            drift = self._drift[index]
+            if drift == 0: continue
+            distance = distances.get( nearestPoint( self.getGhostPosition( index ) ) )
+            if distance != None and distance <= drift + 1:
+                return True
+        return False
+
+    def generatePacmanSuccessors( self, actions, lazy=False ):
+        """
+        Generates the successors for a list of pacman moves at once, in the
+        same order, as generatePacmanSuccessor would one by one.  The legality
+        of the moves is checked once for the whole batch.  Every successor
+        costs one forward model call; entries past the end of the budget are
+        None.  With lazy=True the successors are built as by
+        generateLazyPacmanSuccessor.
+        """
+        if not actions: return []
+        if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+
+        legal = PacmanRules.getLegalCodes( self )
+        successors = []
+        for action in actions:
+            Game.currentIterations -= 1
+            if Game.currentIterations <= 0:
+                successors.append( None )
+                continue
+            if Actions.actionToCode( action ) not in legal:
+                raise Exception("Illegal action " + str(action))
+            if lazy:
+                successors.append( self._lazyRound( action, True ) )
+                continue
+            state = GameState(self)
+            state._applyRound( action, True )
+            successors.append( state )
+        return successors
+
+    def generatePacmanOutcomes( self, action, ghostAgents=None ):
+        """
+        Returns every distinct outcome of the round started by the pacman
+        move, as a list of (state, probability) pairs.  The ghosts reply in
+        turn with each of their actions: uniformly at random, as in
+        generatePacmanSuccessor, or following the getDistribution of the
+        given ghost agents (ghostAgents[i-1] plays ghost i).  Replies that
+        lead to the same state are merged and their probabilities added.
+
+        Every outcome costs one forward model call, charged as it is found.
+        Once the budget runs out the enumeration stops and None is returned.
+        """
+        # The first outcome is paid for up front, as in generatePacmanSuccessor
+        Game.currentIterations -= 1
+        if Game.currentIterations <= 0:
+            return None
+        if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+
+        lastGhost = self.getNumAgents() - 1
+        state = GameState( self )
+        state._applyMove( 0, action )
+        state._nextPly()
+        outcomes = [(state, 1.0)]
+        for i in range(1, self.getNumAgents()):
+            merged = {}
+            nextOutcomes = []
+            for state, probability in outcomes:
+                if state.isWin() or state.isLose():
+                    replies = [(None, 1.0)]
+                else:
+                    replies = state._getGhostReplies( i, ghostAgents )
+                for reply, replyProbability in replies:
+                    if reply == None:
+                        successor = state
+                    else:
+                        successor = GameState( state )
+                        successor._applyMove( i, reply, ghostAgents == None )
+                    if successor in merged:
+                        index = merged[successor]
+                        nextOutcomes[index] = (nextOutcomes[index][0], nextOutcomes[index][1] + probability * replyProbability)
+                    else:
+                        merged[successor] = len( nextOutcomes )
+                        nextOutcomes.append( (successor, probability * replyProbability) )
+                        if i == lastGhost and len( nextOutcomes ) > 1:
+                            Game.currentIterations -= 1
+                            if Game.currentIterations <= 0:
+                                return None
+            outcomes = nextOutcomes
+        return outcomes
+
+    def _getGhostReplies( self, ghostIndex, ghostAgents=None ):
+        "Returns the (action, probability) pairs of a ghost's possible replies."
+        if ghostAgents == None:
+            actions = GhostRules.getLegalCodes( self, ghostIndex )
+            if len(actions) == 0: return [(Actions.STOP_CODE, 1.0)]
+            return [(action, 1.0 / len(actions)) for action in actions]
+        distribution = ghostAgents[ghostIndex - 1].getDistribution( self )
+        replies = [(action, p) for action, p in distribution.items() if p > 0]
+        if len(replies) == 0: return [(Directions.STOP, 1.0)]
+        total = float( sum( [p for action, p in replies] ) )
+        return [(action, p / total) for action, p in replies]
 
     def getPacmanState( self ):
         """
@@ -227,14 +374,160 @@ class GameState:
         """
         if prevState != None: # Initial state
             self.data = GameStateData(prevState.data)
+            if prevState._drift != None: self._drift = prevState._drift
+            if prevState._crn != None:
+                self._crn = prevState._crn
+                self._ply = prevState._ply
         else:
             self.data = GameStateData()
 
+    def _applyMove( self, agentIndex, action, trusted=False ):
+        """
+        Applies one agent's move to this state in place.  Only called on states
+        that are not yet visible to anybody else (fresh successors).
+        """
+        # Let agent's logic deal with its action's effects on the board
+        if agentIndex == 0:  # Pacman is moving
+            self.data._eaten = [False for i in range(self.getNumAgents())]
+            PacmanRules.applyAction( self, action, trusted )
+        else:                # A ghost is moving
+            GhostRules.applyAction( self, action, agentIndex, trusted )
+
+        # Time passes
+        if agentIndex == 0:
+            self.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
+        else:
+            GhostRules.decrementTimer( self, agentIndex )
+
+        # Resolve multi-agent effects
+        GhostRules.checkDeath( self, agentIndex )
+
+        # Book keeping
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
+
     def deepCopy( self ):
         state = GameState( self )
         state.data = self.data.deepCopy()
         return state
 
+    def _applyRound( self, action, trusted=False, horizon=None ):
+        """
+        Applies Pacman's move and one random reply from every ghost to this
+        state in place, stopping early if the game ends.  With a horizon the
+        ghosts out of reach are left where they are (see _freezeGhosts).
+        """
+        self._applyMove( 0, action, trusted )
+        if self._crn != None: self._ply += 1
+        if horizon == None:
+            self._applyGhostReplies()
+        elif not (self.isWin() or self.isLose()):
+            self._applyGhostReplies( self._freezeGhosts( horizon ) )
+
+    def _applyGhostReplies( self, frozen=() ):
+        """
+        Applies one random move of every ghost not frozen in turn, as in
+        _applyRound.  A frozen ghost stays put, but its scared timer still
+        runs down as it would have.
+        """
+        for i in range(1, self.getNumAgents()):
+            if self.isWin() or self.isLose():
+                break
+            if i in frozen:
+                GhostRules.decrementTimer( self, i )
+                continue
+            ghostAction = self._drawGhostAction( i )
+            self.data.resetMoveInfo()
+            self._applyMove( i, ghostAction, True )
+
+    def _drawGhostAction( self, ghostIndex ):
+        "Returns the code of a uniformly random legal action of the ghost."
+        actions = GhostRules.getLegalCodes( self, ghostIndex )
+        if len(actions) > 0:
+            if self._crn != None:
+                return actions[self._crn.draw( self._ply, ghostIndex, len(actions) )]
+            return actions[random.randint(0, len(actions) - 1)]
+        return Actions.STOP_CODE
+
+    def _nextPly( self ):
+        if self._crn != None: self._ply += 1
+
+    def _freezeGhosts( self, horizon ):
+        """
+        Returns the ghosts that cannot reach Pacman in the next horizon rounds
+        and adds their skipped move to the drift of this state.  Only their
+        moves are skipped: the caller still runs down their scared timers.  Pacman and a
+        ghost close in by at most two cells a round; the extra cell covers
+        collisions and ghosts between cells.
+        """
+        numAgents = self.getNumAgents()
+        distances = self.data.layout.getMazeDistances( nearestPoint( self.getPacmanPosition() ) )
+        drift = list( self._drift or [0] * numAgents )
+        frozen = []
+        for index in range( 1, numAgents ):
+            distance = distances.get( nearestPoint( self.getGhostPosition( index ) ) )
+            if distance == None or distance > 2 * horizon + 1:
+                frozen.append( index )
+                drift[index] += 1
+        self._drift = tuple( drift )
+        return frozen
+
+    def _lazyRound( self, action, trusted=False, horizon=None ):
+        """
+        Returns a successor of this state after Pacman's move, with the ghosts'
+        replies drawn but deferred (see LazyGameState).  When a ghost is close
+        enough to reach Pacman the replies can end the game or change each
+        other, so they are applied at once and a plain GameState is returned.
+        """
+        state = GameState( self )
+        state._applyMove( 0, action, trusted )
+        state._nextPly()
+        if state.isWin() or state.isLose():
+            return state
+        frozen = ()
+        if horizon != None: frozen = state._freezeGhosts( horizon )
+        agentStates = state.data.agentStates
+        pacmanPosition = agentStates[0].configuration.pos
+        reach = GhostRules.GHOST_SPEED + COLLISION_TOLERANCE
+        ghosts = [i for i in range(1, len(agentStates)) if i not in frozen]
+        for i in ghosts:
+            if manhattanDistance( agentStates[i].configuration.pos, pacmanPosition ) <= reach:
+                state._applyGhostReplies( frozen )
+                return state
+        moves = [(i, state._drawGhostAction( i )) for i in ghosts]
+        for i in frozen: GhostRules.decrementTimer( state, i )
+        lazy = LazyGameState( state.data, moves )
+        if state._drift != None: lazy._drift = state._drift
+        if state._crn != None:
+            lazy._crn = state._crn
+            lazy._ply = state._ply
+        return lazy
+
+    def makeObservation( self ):
+        """
+        Returns a copy of this state for an agent to look at and search from.
+
+        The observation gets its own food, capsules and agent states, so
+        writing to them (getFood()[x][y] = False, getGhostState(1).scaredTimer
+        = 0) leaves this state alone.  Only the layout is shared; its walls
+        and food are frozen grids.  Copying food is O(1) for a BitGrid, and
+        agent states are small slotted objects, so this is still far cheaper
+        than deepCopy.
+        """
+        state = GameState( self )
+        data = state.data
+        data.food = data.food.copy()
+        data.capsules = data.capsules[:]
+        data.agentStates = data.copyAgentStates( data.agentStates )
+        data.takeOwnership()
+        state.data._agentMoved = self.data._agentMoved
+        state.data._foodEaten = self.data._foodEaten
+        state.data._foodAdded = self.data._foodAdded
+        state.data._capsuleEaten = self.data._capsuleEaten
+        state.data._win = self.data._win
+        state.data._lose = self.data._lose
+        return state
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -257,6 +550,138 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+class SearchState( GameState ):
+    """
+    A GameState that a search agent changes in place instead of allocating a
+    new state for every node.
+
+    apply(action) plays one full round, exactly like generatePacmanSuccessor
+    (including its cost against the forward model budget), and returns an
+    undo record.  undo(record) puts the state back exactly as it was before
+    that apply.  Records must be undone in the reverse order they were made:
+
+      record = searchState.apply(action)
+      ...look at searchState, recurse...
+      searchState.undo(record)
+
+    apply returns None, leaving the state unchanged, once the budget is spent.
+
+    The round changes food, capsules and agent states in place; the data's
+    journal keeps the values it overwrote, and the record is just the
+    journal's length before the round.  Containers still shared with another
+    state are copied the first time they change, as for any successor.
+    """
+    def __init__( self, gameState ):
+        GameState.__init__( self, gameState )
+        self.data._win = gameState.data._win
+        self.data._lose = gameState.data._lose
+        self.data._journal = []
+
+    def apply( self, action, trusted=False ):
+        Game.currentIterations -= 1
+        if Game.currentIterations <= 0:
+            return None
+        if self.isWin() or self.isLose(): raise Exception('Can\'t apply an action to a terminal state.')
+
+        data = self.data
+        journal = data._journal
+        mark = len( journal )
+        journal.append( (data._eaten, data._zobrist, data.score, data.scoreChange,
+                         data._agentMoved, data._foodEaten, data._foodAdded, data._capsuleEaten) )
+        data.resetMoveInfo()
+        self._applyRound( action, trusted )
+        return mark
+
+    def undo( self, record ):
+        data = self.data
+        data.rollBack( record + 1 )
+        (data._eaten, data._zobrist, data.score, data.scoreChange, data._agentMoved,
+         data._foodEaten, data._foodAdded, data._capsuleEaten) = data._journal.pop()
+        data._win = False
+        data._lose = False
+        if self._crn != None: self._ply -= 1
+
+class LazyGameState( GameState ):
+    """
+    A Pacman successor whose ghost replies are drawn but not yet applied; see
+    generateLazyPacmanSuccessor.  No ghost is within reach of Pacman, so the
+    replies cannot change the score, the food, Pacman or the end of the game,
+    and the accessors for those answer without applying them.  Anything else
+    that reads state.data applies them first.
+    """
+    def __init__( self, data, moves ):
+        self._data = data
+        self._pending = moves
+
+    def __getattr__( self, name ):
+        if name != 'data': raise AttributeError( name )
+        self.data = self._data
+        for ghostIndex, code in self._pending:
+            self.data.resetMoveInfo()
+            self._applyMove( ghostIndex, code, True )
+        self._pending = ()
+        return self.data
+
+    def getLegalActions( self, agentIndex=0 ):
+        data = self._data
+        if agentIndex != 0 or data._win or data._lose:
+            return GameState.getLegalActions( self, agentIndex )
+        actions = data.layout.legalActions.get( data.agentStates[0].configuration.pos )
+        if actions == None:
+            return GameState.getLegalActions( self, agentIndex )
+        return list( actions )
+
+    def getPacmanState( self ):
+        return self._data.agentStates[0].copy()
+
+    def getPacmanPosition( self ):
+        return self._data.agentStates[0].getPosition()
+
+    def getScore( self ):
+        return float(self._data.score)
+
+    def getCapsules( self ):
+        return self._data.capsules
+
+    def getNumFood( self ):
+        return self._data.food.count()
+
+    def getFood( self ):
+        return self._data.food
+
+    def getWalls( self ):
+        return self._data.layout.walls
+
+    def hasFood( self, x, y ):
+        return self._data.food[x][y]
+
+    def hasWall( self, x, y ):
+        return self._data.layout.walls[x][y]
+
+    def isLose( self ):
+        return self._data._lose
+
+    def isWin( self ):
+        return self._data._win
+
+class CommonRandomNumbers:
+    """
+    A fixed random stream for every (round, ghost) pair: sample(ply, index)
+    is a number in [0, 1) that depends only on the seed, the round and the
+    ghost.  States built by withCommonRandomNumbers draw the ghosts' replies
+    from it, as draw(ply, index, number of legal actions).
+    """
+    def __init__( self, seed ):
+        self.seed = seed
+        self._key = Zobrist.mix( seed )
+
+    def sample( self, ply, ghostIndex ):
+        return ( Zobrist.mix( self._key ^ Zobrist.mix( ( ply << 8 ) | ghostIndex ) ) >> 11 ) / 9007199254740992.0
+
+    def draw( self, ply, ghostIndex, n ):
+        "Returns int(u * n) for the sample u of the round and ghost."
+        return int( self.sample( ply, ghostIndex ) * n )
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -267,6 +692,11 @@ SCARED_TIME = 40    # Moves ghosts are scared
 COLLISION_TOLERANCE = 0.7 # How close ghosts must be to Pacman to kill
 TIME_PENALTY = 0 # Number of points lost each round
 
+# Resolve eating and collisions on integer half-cell positions
+# (Configuration.half) instead of float positions.  Both give the same games.
+FIXED_POINT = True
+KILL_DISTANCE = int(2 * COLLISION_TOLERANCE) # COLLISION_TOLERANCE in half cells
+
 class ClassicGameRules:
     """
     These game rules manage the control flow of a game, deciding when
@@ -335,29 +765,67 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        configuration = state.data.agentStates[0].configuration
+        actions = state.data.layout.legalActions.get( configuration.pos )
+        if actions == None:
+            return Actions.getPossibleActions( configuration, state.data.layout.walls )
+        return list( actions )
     getLegalActions = staticmethod( getLegalActions )
 
-    def applyAction( state, action ):
+    def getLegalCodes( state ):
+        """
+        Returns the legal actions as a tuple of integer action codes.
         """
-        Edits the state to reflect the results of the action.
+        configuration = state.data.agentStates[0].configuration
+        codes = state.data.layout.legalCodes.get( configuration.pos )
+        if codes == None:
+            actions = Actions.getPossibleActions( configuration, state.data.layout.walls )
+            return tuple( [Actions.actionToCode( a ) for a in actions] )
+        return codes
+    getLegalCodes = staticmethod( getLegalCodes )
+
+    def applyAction( state, action, trusted=False ):
         """
-        legal = PacmanRules.getLegalActions( state )
-        if action not in legal:
-            raise Exception("Illegal action " + str(action))
+        Edits the state to reflect the results of the action, given as a string
+        or an action code.  A trusted action is known to come from
+        getLegalActions and is not checked again.
+        """
+        code = Actions._actionToCode.get( action, action )
+        if not trusted:
+            legal = PacmanRules.getLegalCodes( state )
+            if code not in legal:
+                raise Exception("Illegal action " + str(action))
 
         pacmanState = state.data.agentStates[0]
 
-        # Update Configuration
-        vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
-        pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
+        # Update Configuration, one cell at a time through the layout's table
+        current = pacmanState.configuration
+        next = None
+        if PacmanRules.PACMAN_SPEED == 1:
+            cells = state.data.layout.neighborCells.get( current.pos )
+            if cells != None: next = cells[code]
+        if next == None:
+            configuration = current.getSuccessor( code, PacmanRules.PACMAN_SPEED )
+        elif code == Actions.STOP_CODE:
+            configuration = Configuration( next, current.direction )
+        else:
+            configuration = Configuration( next, Actions._codeToAction[code] )
+        state.data.moveAgent( 0, configuration )
 
         # Eat
-        next = pacmanState.configuration.getPosition()
-        nearest = nearestPoint( next )
-        if manhattanDistance( nearest, next ) <= 0.5 :
-            # Remove food
-            PacmanRules.consume( nearest, state )
+        half = configuration.half
+        if FIXED_POINT and half != None:
+            hx, hy = half
+            nearest = ( (hx + 1) >> 1, (hy + 1) >> 1 )
+            if abs( hx - 2 * nearest[0] ) + abs( hy - 2 * nearest[1] ) <= 1:
+                # Remove food
+                PacmanRules.consume( nearest, state )
+        else:
+            next = configuration.getPosition()
+            nearest = nearestPoint( next )
+            if manhattanDistance( nearest, next ) <= 0.5 :
+                # Remove food
+                PacmanRules.consume( nearest, state )
     applyAction = staticmethod( applyAction )
 
     def consume( position, state ):
@@ -365,21 +833,20 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood( x, y )
             state.data._foodEaten = position
-            # TODO: cache numFood?
+            # BitGrid food keeps its count up to date; Grid food rescans
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.removeCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.setScaredTimer( index, SCARED_TIME )
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -393,6 +860,9 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
+        possibleActions = state.data.layout.ghostActions.get( ( conf.pos, conf.direction ) )
+        if possibleActions != None:
+            return list( possibleActions )
         possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
@@ -402,47 +872,76 @@ class GhostRules:
         return possibleActions
     getLegalActions = staticmethod( getLegalActions )
 
-    def applyAction( state, action, ghostIndex):
-
-        legal = GhostRules.getLegalActions( state, ghostIndex )
-        if action not in legal:
-            raise Exception("Illegal ghost action " + str(action))
+    def getLegalCodes( state, ghostIndex ):
+        """
+        Returns the legal actions as a tuple of integer action codes.
+        """
+        conf = state.data.agentStates[ghostIndex].configuration
+        codes = state.data.layout.ghostCodes.get( ( conf.pos, conf.directionCode ) )
+        if codes == None:
+            actions = GhostRules.getLegalActions( state, ghostIndex )
+            return tuple( [Actions.actionToCode( a ) for a in actions] )
+        return codes
+    getLegalCodes = staticmethod( getLegalCodes )
+
+    def applyAction( state, action, ghostIndex, trusted=False ):
+
+        code = Actions._actionToCode.get( action, action )
+        if not trusted:
+            legal = GhostRules.getLegalCodes( state, ghostIndex )
+            if code not in legal:
+                raise Exception("Illegal ghost action " + str(action))
 
         ghostState = state.data.agentStates[ghostIndex]
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
-        vector = Actions.directionToVector( action, speed )
-        ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
+        state.data.moveAgent( ghostIndex, ghostState.configuration.getSuccessor( code, speed ) )
     applyAction = staticmethod( applyAction )
 
-    def decrementTimer( ghostState):
-        timer = ghostState.scaredTimer
+    def decrementTimer( state, ghostIndex ):
+        timer = state.data.agentStates[ghostIndex].scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
-        ghostState.scaredTimer = max( 0, timer - 1 )
+            conf = state.data.agentStates[ghostIndex].configuration
+            if FIXED_POINT and conf.half != None:
+                hx, hy = conf.half
+                nearest = ( (hx + 1) >> 1, (hy + 1) >> 1 )
+            else:
+                nearest = nearestPoint( conf.pos )
+            state.data.moveAgent( ghostIndex, Configuration( nearest, conf.direction ) )
+        state.data.setScaredTimer( ghostIndex, max( 0, timer - 1 ) )
     decrementTimer = staticmethod( decrementTimer )
 
     def checkDeath( state, agentIndex):
-        pacmanPosition = state.getPacmanPosition()
+        pacmanConfiguration = state.data.agentStates[0].configuration
         if agentIndex == 0: # Pacman just moved; Anyone can kill him
             for index in range( 1, len( state.data.agentStates ) ):
                 ghostState = state.data.agentStates[index]
-                ghostPosition = ghostState.configuration.getPosition()
-                if GhostRules.canKill( pacmanPosition, ghostPosition ):
+                if GhostRules.touches( pacmanConfiguration, ghostState.configuration ):
                     GhostRules.collide( state, ghostState, index )
         else:
             ghostState = state.data.agentStates[agentIndex]
-            ghostPosition = ghostState.configuration.getPosition()
-            if GhostRules.canKill( pacmanPosition, ghostPosition ):
+            if GhostRules.touches( pacmanConfiguration, ghostState.configuration ):
                 GhostRules.collide( state, ghostState, agentIndex )
     checkDeath = staticmethod( checkDeath )
 
+    def touches( pacmanConfiguration, ghostConfiguration ):
+        """
+        canKill for two configurations, compared in half cells when possible.
+        """
+        if FIXED_POINT:
+            pacmanHalf, ghostHalf = pacmanConfiguration.half, ghostConfiguration.half
+            if pacmanHalf != None and ghostHalf != None:
+                return abs( pacmanHalf[0] - ghostHalf[0] ) + abs( pacmanHalf[1] - ghostHalf[1] ) <= KILL_DISTANCE
+        return GhostRules.canKill( pacmanConfiguration.pos, ghostConfiguration.pos )
+    touches = staticmethod( touches )
+
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
-            GhostRules.placeGhost(state, ghostState)
-            ghostState.scaredTimer = 0
-            # Added for first-person
+            GhostRules.placeGhost(state, agentIndex)
+            state.data.setScaredTimer( agentIndex, 0 )
+            # Added for first-person; the list may be shared with the parent
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -454,8 +953,8 @@ class GhostRules:
         return manhattanDistance( ghostPosition, pacmanPosition ) <= COLLISION_TOLERANCE
     canKill = staticmethod( canKill )
 
-    def placeGhost(state, ghostState):
-        ghostState.configuration = ghostState.start
+    def placeGhost(state, ghostIndex):
+        state.data.moveAgent( ghostIndex, state.data.agentStates[ghostIndex].start )
     placeGhost = staticmethod( placeGhost )
 
 #############################
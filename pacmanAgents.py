@@ -13,11 +13,375 @@
 
 
 from pacman import Directions
+from pacman import SearchState
+from pacman import GhostRules
+from pacman import COLLISION_TOLERANCE
+from game import Game
 from game import Agent
 from heuristics import scoreEvaluation
+from heuristics import normalizedScoreEvaluation
+from searchSession import searchWindow
+from game import Actions
+from util import manhattanDistance
+from collections import deque
+from collections import OrderedDict
+from array import array
+import heapq
+import math
 import random
-
-
+import time
+
+# Let rollouts leave ghosts that are too far away to matter where they are
+# (the horizon of generatePacmanSuccessor).  Faster, but no longer exact.
+APPROXIMATE_ROLLOUTS = False
+
+def rolloutHorizon(remaining):
+    "Returns the horizon to pass for a rollout with remaining rounds to go."
+    if APPROXIMATE_ROLLOUTS: return remaining
+    return None
+
+# Let every candidate move of one getAction meet the same ghost luck
+# (GameState.withCommonRandomNumbers).  Less noise, but different games.
+COMMON_RANDOM_NUMBERS = False
+
+def rolloutAction(state, action):
+    "Returns action if Pacman can take it in state, else a random move he can."
+    legal = state.getLegalPacmanActions()
+    if action in legal: return action
+    return random.choice(legal)
+
+def searchRoot(state):
+    "Returns the state to search from: state, or a copy with common random numbers."
+    if COMMON_RANDOM_NUMBERS: return state.withCommonRandomNumbers(random.getrandbits(64))
+    return state
+
+# The most nodes a SearchKernel makes and the most states it holds in its
+# frontier at once, whatever the forward model budget.
+MAX_SEARCH_NODES = 1000000
+MAX_FRONTIER_STATES = 100000
+
+# The deepest iteration IDDFSAgent starts, whatever the budget left.
+MAX_DEEPENING_DEPTH = 100
+
+# The positions the search agents remember per move to skip duplicates
+# (TranspositionTable); 0 turns the table off.
+TRANSPOSITION_TABLE_SIZE = 100000
+# Whether a full table forgets the key visited longest ago rather than the
+# oldest one.
+TRANSPOSITION_TABLE_LRU = False
+
+
+class QueueFrontier:
+    "First in, first out (breadth first search)."
+    def __init__(self):
+        self.entries = deque()
+
+    def push(self, entry, priority=None, key=None):
+        self.entries.append(entry)
+        return True
+
+    def pop(self):
+        return self.entries.popleft()
+
+    def __len__(self):
+        return len(self.entries)
+
+class StackFrontier:
+    "Last in, first out (depth first search)."
+    def __init__(self):
+        self.entries = []
+
+    def push(self, entry, priority=None, key=None):
+        self.entries.append(entry)
+        return True
+
+    def pop(self):
+        return self.entries.pop()
+
+    def __len__(self):
+        return len(self.entries)
+
+class PriorityFrontier:
+    """
+    Lowest priority first, first in first out among equals (A*).  An entry
+    pushed with a key replaces, in effect, any earlier entry with that key:
+    the heap keeps the best priority seen per key, a push that does not beat
+    it is dropped (push returns False), and a beaten entry still in the heap
+    is skipped when it comes up (lazy deletion).
+    """
+    def __init__(self):
+        self.entries = []
+        self.counter = 0
+        self.bestPriorities = {}
+        self.stale = 0
+
+    def push(self, entry, priority=None, key=None):
+        if key != None:
+            if key in self.bestPriorities and self.bestPriorities[key] <= priority: return False
+            self.bestPriorities[key] = priority
+        heapq.heappush(self.entries, (priority, self.counter, key, entry))
+        self.counter += 1
+        return True
+
+    def pop(self):
+        while True:
+            priority, counter, key, entry = heapq.heappop(self.entries)
+            if key == None or self.bestPriorities[key] == priority: return entry
+            self.stale += 1
+
+    def __nonzero__(self):
+        # Stale entries are not counted as waiting
+        while self.entries:
+            priority, counter, key, entry = self.entries[0]
+            if key == None or self.bestPriorities[key] == priority: return True
+            heapq.heappop(self.entries)
+            self.stale += 1
+        return False
+
+    def __len__(self):
+        return len(self.entries)
+
+def positionKey(state):
+    """
+    Returns a compact key of what Pacman has left to do from a state: his
+    position, the food bits and the capsules.  The ghosts and the score are
+    left out, so states that differ only in those share a key.
+    """
+    data = state.data
+    food = data.food
+    if hasattr(food, 'bits'): foodKey = food.bits
+    else: foodKey = food.packBits()
+    return (data.agentStates[0].configuration.pos, foodKey, tuple(data.capsules))
+
+def predictPositionKey(state, action):
+    """
+    Returns the positionKey of the successor of state for Pacman's move
+    action without calling the forward model, or None if the move might end
+    the game (it eats the last food, or a ghost is within reach) or the food
+    is not a BitGrid.  Pacman's own move is deterministic and the ghosts are
+    not part of the key.
+    """
+    position, foodKey, capsules = positionKey(state)
+    x, y = Actions.getSuccessor(position, action)
+    x, y = int(x), int(y)
+    reach = GhostRules.GHOST_SPEED + COLLISION_TOLERANCE
+    for ghostState in state.getGhostStates():
+        if manhattanDistance(ghostState.getPosition(), (x, y)) <= reach: return None
+    if state.hasFood(x, y):
+        food = state.data.food
+        if state.getNumFood() == 1 or not hasattr(food, 'bits'): return None
+        foodKey ^= 1 << (x * food.height + y)
+    if (x, y) in capsules:
+        capsules = list(capsules)
+        capsules.remove((x, y))
+        capsules = tuple(capsules)
+    return ((x, y), foodKey, capsules)
+
+class TranspositionTable:
+    """
+    Remembers the depth at which each position key was first reached, for up
+    to capacity keys.  visit(key, depth) says whether a node should be kept:
+    yes for a new key or one now reached at a shallower depth (the shallower
+    entry replaces the deeper one), no for a duplicate.  A full table forgets
+    its oldest key, or with lru=True the one visited longest ago.
+    """
+    def __init__(self, capacity=TRANSPOSITION_TABLE_SIZE, lru=False):
+        self.capacity = capacity
+        self.lru = lru
+        self.depths = OrderedDict()
+        self.hits = 0
+        self.replaced = 0
+        self.evicted = 0
+
+    def visit(self, key, depth):
+        if key in self.depths:
+            oldDepth = self.depths[key]
+            if self.lru:
+                del self.depths[key]
+                self.depths[key] = oldDepth
+            if oldDepth <= depth:
+                self.hits += 1
+                return False
+            self.depths[key] = depth
+            self.replaced += 1
+            return True
+        if len(self.depths) >= self.capacity:
+            self.depths.popitem(last=False)
+            self.evicted += 1
+        self.depths[key] = depth
+        return True
+
+    def isDuplicate(self, key, depth):
+        """
+        Says whether visit(key, depth) would drop the node.  A duplicate
+        counts as a hit, as in visit; a key that is not one is not recorded.
+        """
+        if key not in self.depths or self.depths[key] > depth: return False
+        if self.lru:
+            oldDepth = self.depths.pop(key)
+            self.depths[key] = oldDepth
+        self.hits += 1
+        return True
+
+    def __len__(self):
+        return len(self.depths)
+
+def makeTranspositionTable():
+    "Returns a fresh table of TRANSPOSITION_TABLE_SIZE keys, or None if turned off."
+    if TRANSPOSITION_TABLE_SIZE: return TranspositionTable(TRANSPOSITION_TABLE_SIZE, TRANSPOSITION_TABLE_LRU)
+    return None
+
+class SearchKernel:
+    """
+    The tree search shared by the search agents.  Nodes are expanded in the
+    order of the frontier until the forward model budget runs out, a node
+    cap is hit or the game ends; every node that was not expanded (a win, a
+    loss, or a node left when the search stopped) is a leaf, and search
+    returns the first action towards the leaf with the best scoreEvaluation.
+
+    Nodes live in arrays: node i has parents[i] and firstActions[i] (an
+    action code) and depths[i].  Only nodes in the frontier hold a state.
+    With a heuristic (depth, root score, node score) -> priority every node
+    is scored when it is made and pushed with that priority and its Zobrist
+    key, so a PriorityFrontier keeps only the cheapest path to a state;
+    otherwise only leaves are scored.  maxNodes caps the nodes made
+    (reaching it stops the search) and maxFrontier the states held at once
+    (a node that would go over it is a leaf), which bounds the memory a
+    search uses.
+
+    Given a TranspositionTable, a child whose positionKey was already reached
+    at the same depth or shallower is dropped rather than searched again.
+    When the key follows from Pacman's move alone (predictPositionKey) the
+    child is dropped before it is generated, so it costs no budget.  Wins and
+    losses are always kept.
+
+    Given a SearchSession, successors come from its pool, and every state
+    but the root goes back to it once it has been expanded, scored as a
+    leaf or dropped.
+    """
+    def __init__(self, frontier, heuristic=None, maxNodes=MAX_SEARCH_NODES, maxFrontier=MAX_FRONTIER_STATES,
+                 table=None, session=None):
+        self.frontierClass = frontier
+        self.heuristic = heuristic
+        self.table = table
+        self.session = session
+        self.maxNodes = maxNodes
+        self.maxFrontier = maxFrontier
+
+    def search(self, root):
+        self.parents = array('i', [-1])
+        self.firstActions = array('b', [-1])
+        self.depths = array('H', [0])
+        self.bestScore = None
+        self.bestNode = None
+        self.expanded = 0
+        self.leaves = 0
+        self.dropped = 0
+        self.transpositions = 0
+        startTime = time.time()
+        self.rootScore = scoreEvaluation(root)
+        if self.table != None: self.table.visit(positionKey(root), 0)
+        frontier = self.frontierClass()
+        frontier.push((0, root, self.rootScore), 0)
+        stopped = False
+        while frontier:
+            index, state, score = frontier.pop()
+            if stopped or index > 0 and (state.isWin() or state.isLose()):
+                self.addLeaf(index, state, score)
+                continue
+            legal = state.getLegalPacmanActions()
+            if self.table != None: legal = self.skipDuplicates(state, legal, self.depths[index] + 1)
+            if self.maxNodes != None and len(self.parents) + len(legal) > self.maxNodes:
+                stopped = True
+                self.addLeaf(index, state, score)
+                continue
+            if self.maxFrontier != None and len(frontier) + len(legal) > self.maxFrontier:
+                self.addLeaf(index, state, score)
+                continue
+            children = self.generateSuccessors(state, legal)
+            if None in children:
+                # Out of budget: this node and everything still waiting are leaves
+                stopped = True
+                for child in children:
+                    if child != None: self.release(child)
+                self.addLeaf(index, state, score)
+                continue
+            self.expanded += 1
+            if index > 0: self.release(state)
+            depth = self.depths[index] + 1
+            for child, action in zip(children, legal):
+                if self.table != None and not (child.isWin() or child.isLose()) and \
+                   not self.table.visit(positionKey(child), depth):
+                    self.transpositions += 1
+                    self.release(child)
+                    continue
+                childIndex = self.addNode(index, action)
+                childScore = None
+                priority = None
+                key = None
+                if self.heuristic != None:
+                    childScore = scoreEvaluation(child)
+                    priority = self.heuristic(self.depths[childIndex], self.rootScore, childScore)
+                    key = child.data.getZobristKey()
+                if not frontier.push((childIndex, child, childScore), priority, key):
+                    self.dropped += 1
+                    self.release(child)
+        self.stale = getattr(frontier, 'stale', 0)
+        self.time = time.time() - startTime
+        if self.bestNode == None: return Directions.STOP
+        return Actions.codeToAction(self.firstActions[self.bestNode])
+
+    def skipDuplicates(self, state, actions, depth):
+        "Returns the moves of state whose successor at depth is not known to be a duplicate."
+        kept = []
+        for action in actions:
+            key = predictPositionKey(state, action)
+            if key != None and self.table.isDuplicate(key, depth):
+                self.transpositions += 1
+            else:
+                kept.append(action)
+        return kept
+
+    def generateSuccessors(self, state, actions):
+        "Returns the successors of state for actions, from the session's pool if there is one."
+        if self.session == None: return state.generatePacmanSuccessors(actions)
+        return [self.session.generatePacmanSuccessor(state, action, True) for action in actions]
+
+    def release(self, state):
+        if self.session != None: self.session.release(state)
+
+    def addNode(self, parent, action):
+        if parent == 0: firstAction = Actions.actionToCode(action)
+        else: firstAction = self.firstActions[parent]
+        self.parents.append(parent)
+        self.firstActions.append(firstAction)
+        self.depths.append(self.depths[parent] + 1)
+        return len(self.parents) - 1
+
+    def addLeaf(self, index, state, score):
+        if index == 0: return # The root has no first action
+        self.leaves += 1
+        if score == None: score = scoreEvaluation(state)
+        self.release(state)
+        if self.bestNode == None or score > self.bestScore:
+            self.bestScore = score
+            self.bestNode = index
+
+    def getStats(self):
+        """
+        Returns, for the last search: the nodes made, expanded and scored as
+        leaves, the duplicates dropped on push, skipped as stale on pop and
+        pruned by the transposition table,
+        the time taken and the expansions per second.
+        """
+        return {'nodes': len(self.parents),
+                'expanded': self.expanded,
+                'leaves': self.leaves,
+                'dropped': self.dropped,
+                'stale': self.stale,
+                'transpositions': self.transpositions,
+                'time': self.time,
+                'expansionsPerSecond': self.expanded / max(self.time, 1e-9)}
 
 class RandomAgent(Agent):
     # Initialization Function: Called one time when the game starts
@@ -58,55 +422,13 @@ class BFSAgent(Agent):
         return;
 
     # GetAction Function: Called with every frame
+    @searchWindow
     def getAction(self, state):
-        # TODO: write BFS Algorithm instead of returning Directions.STOP
-        queue = []  #creating a queue
-        leaves = []
-
-        legal = state.getLegalPacmanActions()
-        if legal:
-            successor = [(state.generatePacmanSuccessor(action), action) for action in legal]
-        for i in successor:
-            node = {}
-            node["parent"] = node
-            node["action"] = i[1]
-            node["state"] = i[0]
-            queue.append(node)
-
-        while queue:
-            node = queue.pop(0)
-            curr_state = node["state"]
-            parent_action = node["action"]
-
-            if curr_state is not None:
-                legal = curr_state.getLegalPacmanActions()
-                if legal is not None:
-                    successor = []
-                    for action in legal:
-                        instance = curr_state.generatePacmanSuccessor(action)
-                        if(instance is not None):
-                            successor.append((instance,parent_action))
-
-
-                if (curr_state.isWin() or curr_state.isLose() or instance is None):
-                    leaves.append(node)
-                else:
-                     for child in successor:
-                         sub_node ={}
-                         sub_node["state"] = child[0]
-                         sub_node["action"] = child[1]
-                         sub_node["parent"] = node
-                         queue.append(sub_node)
-
-
-        max_score = -9999
-
-        if leaves:
-            for value in leaves:
-                 if((scoreEvaluation(value["state"])>max_score)):
-                     max_score  = scoreEvaluation(value["state"])
-                     result = value["action"]
-            return result
+        kernel = SearchKernel(QueueFrontier, table=makeTranspositionTable(),
+                              session=self.session)
+        action = kernel.search(state)
+        self.kernelStats = kernel.getStats()
+        return action
 
 
 class DFSAgent(Agent):
@@ -115,123 +437,121 @@ class DFSAgent(Agent):
         return;
 
     # GetAction Function: Called with every frame
+    @searchWindow
     def getAction(self, state):
-        # TODO: write DFS Algorithm instead of returning Directions.STOP
-
-        stack = []   #creating a stack
-        leaves = []
+        kernel = SearchKernel(StackFrontier, table=makeTranspositionTable(),
+                              session=self.session)
+        action = kernel.search(state)
+        self.kernelStats = kernel.getStats()
+        return action
+
+class IDDFSAgent(Agent):
+    """
+    Iterative deepening: depth limited searches of depth 1, 2, ... on one
+    SearchState changed in place with apply and undo, so memory grows with
+    the depth only.  A move that brings back a position (positionKey) already
+    on the current path (Stop always does) is a cycle and is not searched.
+    Each depth ends in the best first action towards its leaves; the move
+    played is the one from the last depth that finished within the forward
+    model budget.  A depth is not started when, at the branching seen so
+    far, it could not finish with the budget left.
+    """
+    # Initialization Function: Called one time when the game starts
+    def registerInitialState(self, state):
+        return;
 
-        legal = state.getLegalPacmanActions()
-        successor = [(state.generatePacmanSuccessor(action),action) for action in legal]
-        for i in successor:
-            node = {}
-            node["parent"] = node
-            node["action"] = i[1]
-            node["state"] =i[0]
-            stack.append(node)
-
-        while stack:
-            node = stack.pop()
-            curr_state = node["state"]
-            parent_action = node["action"]
-
-            if curr_state is not None:
-                legal = curr_state.getLegalPacmanActions()
-                if legal is not None:
-                    #successor =[]
-                    for action in legal:
-                        instance = curr_state.generatePacmanSuccessor(action)
-                        if(instance is not None):
-                            successor = [(instance,parent_action)]
-
-                if (curr_state.isWin()) or (curr_state.isLose()) or (instance is None):
-                    leaves.append(node)
-                else:
-                     for child in successor:
-                         sub_node ={}
-                         sub_node["state"] = child[0]
-                         sub_node["action"] = child[1]
-                         sub_node["parent"] = node
-                         stack.append(sub_node)
-
-        max_score = -9999999
-        if leaves:
-            for value in leaves:
-                 if(scoreEvaluation(value["state"])>max_score):
-                     max_score  = scoreEvaluation(value["state"])
-                     result = value["action"]
-            return result
+    # GetAction Function: Called with every frame
+    @searchWindow
+    def getAction(self, state):
+        root = SearchState(state)
+        bestAction = Directions.STOP
+        self.completedDepth = 0
+        lastNodes = 1
+        for depth in range(1, MAX_DEEPENING_DEPTH + 1):
+            self.nodes = 0
+            self.cutoff = False
+            action = self.searchToDepth(root, depth)
+            if action == None: break # Out of budget
+            bestAction = action
+            self.completedDepth = depth
+            if not self.cutoff: break # Nothing left below this depth
+            # The next depth costs about this one times the branching factor
+            if self.nodes * self.nodes / max(lastNodes, 1) >= Game.currentIterations: break
+            lastNodes = self.nodes
+        return bestAction
+
+    def searchToDepth(self, root, depth):
+        "Returns the best first action of a search to depth, or None if the budget ran out."
+        self.outOfBudget = False
+        path = set([positionKey(root)])
+        bestScore, bestAction = None, None
+        for action in root.getLegalPacmanActions():
+            score = self.searchChild(root, action, depth, path)
+            if self.outOfBudget: return None
+            if score != None and (bestScore == None or score > bestScore):
+                bestScore, bestAction = score, action
+        return bestAction
+
+    def searchChild(self, state, action, depth, path):
+        """
+        Returns the best leaf score under the move action from state, or None
+        if the move is a cycle or the budget ran out (self.outOfBudget).
+        """
+        if self.isCycle(state, action, path): return None
+        record = state.apply(action, True)
+        if record == None:
+            self.outOfBudget = True
+            return None
+        self.nodes += 1
+        key = positionKey(state)
+        if key in path:
+            state.undo(record)
+            return None
+        if state.isWin() or state.isLose() or depth == 1:
+            if depth == 1 and not (state.isWin() or state.isLose()): self.cutoff = True
+            score = scoreEvaluation(state)
+            state.undo(record)
+            return score
+        path.add(key)
+        bestScore = None
+        for childAction in state.getLegalPacmanActions():
+            score = self.searchChild(state, childAction, depth - 1, path)
+            if self.outOfBudget: break
+            if score != None and (bestScore == None or score > bestScore): bestScore = score
+        path.remove(key)
+        if bestScore == None: bestScore = scoreEvaluation(state) # Every move is a cycle
+        state.undo(record)
+        return bestScore
+
+    def isCycle(self, state, action, path):
+        """
+        Tells, without spending budget, whether the move action leads back to
+        a position on the path.  Only a move that eats nothing can, as food
+        and capsules only ever go away.
+        """
+        position, foodKey, capsules = positionKey(state)
+        x, y = Actions.getSuccessor(position, action)
+        x, y = int(x), int(y)
+        if state.hasFood(x, y) or (x, y) in capsules: return False
+        return ((x, y), foodKey, capsules) in path
 
 class AStarAgent(Agent):
     # Initialization Function: Called one time when the game starts
     def registerInitialState(self, state):
         return;
 
-    def sort_nodes(self, list):
-        new = sorted(list, key=lambda k: k['cost'])
-        return new
-
     # GetAction Function: Called with every frame
+    @searchWindow
     def getAction(self, state):
-        pqueue = []  #creating a priority queue
-        leaves = []
-        root = state
-        legal = state.getLegalPacmanActions()
-        successor = [(state.generatePacmanSuccessor(action), action) for action in legal]
-        for i in successor: #Push the successors of parent node into the queue
-            node = {}
-            node["parent"] = state
-            node["action"] = i[1]
-            node["state"] = i[0]
-            node["depth"] = 1
-            node["score"] = scoreEvaluation(root) - scoreEvaluation(node["state"])
-            node["cost"] = node["depth"] + node["score"]
-            pqueue.append(node)
-
-        while pqueue:
-            pqueue = self.sort_nodes(pqueue)
-            node = pqueue.pop(0)
-            curr_state = node["state"]
-            act = node["action"]
-            depth = node["depth"]
-
-            if curr_state is not None:
-                legal = curr_state.getLegalPacmanActions()
-                if legal:
-                    for action in legal:
-                        successor = []
-                        s = curr_state.generatePacmanSuccessor(action)
-                        if s is not None:
-                            successor.append((s, act))
+        # cost = depth + the score lost since the root
+        kernel = SearchKernel(PriorityFrontier, lambda depth, rootScore, score: depth + rootScore - score,
+                              table=makeTranspositionTable(), session=self.session)
+        action = kernel.search(state)
+        self.kernelStats = kernel.getStats()
+        return action
 
-                if (curr_state.isWin()) or (curr_state.isLose()) or (s is None):
-                    leaves.append(node)
 
-                else:
-
-                    for child in successor:
-                        if (child[0] is not None):
-                            sub_node = {}
-                            sub_node["state"] = child[0]
-                            sub_node["action"] = act
-                            sub_node["parent"] = node
-                            sub_node["depth"] = depth + 1
-                            sub_node["score"] = scoreEvaluation(root) - scoreEvaluation(child[0])
-                            sub_node["cost"] = sub_node["depth"] + sub_node["score"]
-                            pqueue.append(sub_node)
-
-        max_score = -99999999
-        if leaves:
-
-            for value in leaves:
-                leaf_score = scoreEvaluation(value["state"])
-                if (leaf_score > max_score):
-                    max_score = leaf_score
-                    result = value["action"]
-            return result
-
-
-			class RandomSequenceAgent(Agent):
+class RandomSequenceAgent(Agent):
     # Initialization Function: Called one time when the game starts
     def registerInitialState(self, state):
         self.actionList = [];
@@ -242,13 +562,16 @@ class AStarAgent(Agent):
     # GetAction Function: Called with every frame
     def getAction(self, state):
         # get all legal actions for pacman
-        possible = state.getAllPossibleActions();
+        possible = state.getLegalPacmanActions();
         for i in range(0,len(self.actionList)):
             self.actionList[i] = possible[random.randint(0,len(possible)-1)];
         tempState = state;
         for i in range(0,len(self.actionList)):
             if tempState.isWin() + tempState.isLose() == 0:
-                tempState = tempState.generatePacmanSuccessor(self.actionList[i]);
+                self.actionList[i] = rolloutAction(tempState, self.actionList[i]);
+                tempState = tempState.generateLazyPacmanSuccessor(self.actionList[i], horizon=rolloutHorizon(len(self.actionList) - i));
+                if tempState is None:
+                    break;
             else:
                 break;
         # returns random action from all the valide actions
@@ -264,7 +587,7 @@ class GreedyAgent(Agent):
         # get all legal actions for pacman
         legal = state.getLegalPacmanActions()
         # get all the successor state for these actions
-        successors = [(state.generatePacmanSuccessor(action), action) for action in legal]
+        successors = zip(searchRoot(state).generatePacmanSuccessors(legal, lazy=True), legal)
         # evaluate the successor states using scoreEvaluation heuristic
         scored = [(scoreEvaluation(state), action) for state, action in successors]
         # get best choice
@@ -295,7 +618,8 @@ class HillClimberAgent(Agent):
         for i in range(len(chromosomes)):
             if curr_state:
                 if curr_state.isWin() + curr_state.isLose() == 0:
-                    curr_state = curr_state.generatePacmanSuccessor(chromosomes[i])
+                    chromosomes[i] = rolloutAction(curr_state, chromosomes[i])
+                    curr_state = curr_state.generateLazyPacmanSuccessor(chromosomes[i], horizon=rolloutHorizon(len(chromosomes) - i))
                 else:
                     break
         if curr_state is None:
@@ -306,7 +630,8 @@ class HillClimberAgent(Agent):
 
     def getAction(self, state):
         # TODO: write Hill Climber Algorithm instead of returning Directions.STOP
-        possible = state.getAllPossibleActions();
+        state = searchRoot(state)
+        possible = state.getLegalPacmanActions();
         # Randomly Populate the ActionList
         self.total_actions = self.populateRandomly(possible)
         maxScore = -9999
@@ -362,7 +687,7 @@ class GeneticAgent(Agent):
 
     def mutate(self,nextgen,state):
         #print nextgen
-        all = state.getAllPossibleActions()
+        all = state.getLegalPacmanActions()
         replacement = random.randint(0,4)
         #print replacement
         nextgen[replacement] = all[random.randint(0, len(all) - 1)]
@@ -373,7 +698,7 @@ class GeneticAgent(Agent):
     def getAction(self, state):
         # TODO: write Genetic Algorithm instead of returning Directions.STOP
         self.flag = True
-        all = state.getAllPossibleActions()
+        all = state.getLegalPacmanActions()
         #print all
         for i in range(8):
             for j in range(5):
@@ -382,9 +707,9 @@ class GeneticAgent(Agent):
 
         #calculate score for each sequence
         score = []
-        cur_state = state
 
         for i in range(8):
+            cur_state = state
             for j in range(5):
                 if cur_state.isWin():
                     return self.total_actions[i][0]
@@ -392,7 +717,8 @@ class GeneticAgent(Agent):
                     break
                 else:
                     #print self.total_actions[j]
-                    cur_state = cur_state.generatePacmanSuccessor(self.total_actions[i][j])
+                    self.total_actions[i][j] = rolloutAction(cur_state, self.total_actions[i][j])
+                    cur_state = cur_state.generateLazyPacmanSuccessor(self.total_actions[i][j], horizon=rolloutHorizon(5 - j))
                     #print scoreEvaluation(cur_state)
             #print cur_state
             score.append(scoreEvaluation(cur_state))
@@ -454,11 +780,8 @@ class GeneticAgent(Agent):
             #print new_generation
             ###scoring
             scores = []
-            cur_state = state
-            if cur_state is None:
-                self.flag = None
-                break
             for i in range(8):
+                cur_state = state
                 for j in range(5):
                     if cur_state:
                         if cur_state.isWin():
@@ -467,7 +790,8 @@ class GeneticAgent(Agent):
                             break
                         else:
                             # print self.total_actions[j]
-                            cur_state = cur_state.generatePacmanSuccessor(new_generation[i][j])
+                            new_generation[i][j] = rolloutAction(cur_state, new_generation[i][j])
+                            cur_state = cur_state.generateLazyPacmanSuccessor(new_generation[i][j], horizon=rolloutHorizon(5 - j))
 
                         # print scoreEvaluation(cur_state)
                     elif cur_state is None:
@@ -504,10 +828,43 @@ class GeneticAgent(Agent):
 
 
 class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search.  The subtree under the move played is kept for
+    the next turn: if the state observed then is the one that subtree was
+    built from (the ghosts replied as they did in the tree), the search
+    resumes from it with its statistics; otherwise it starts a new tree.
+
+    Nodes point back to their parents, so a tree is cyclic; every tree or
+    subtree let go of has those links cut (releaseTree) so that it is freed
+    at once rather than left to the garbage collector, which searchWindow
+    holds back for the move.
+    """
     # Initialization Function: Called one time when the game starts
     def registerInitialState(self, state):
+        self.tree = None
+        self.reusedVisits = 0
         return;
 
+    def reuseTree(self, state):
+        "Returns the kept subtree as a root if it was built from state, else None."
+        node = getattr(self, 'tree', None)
+        self.tree = None
+        if node is None: return None
+        if not node["state"] == state:
+            self.releaseTree(node)
+            return None
+        node["parent"] = None
+        node["action"] = None
+        return node
+
+    def releaseTree(self, node):
+        "Cuts the parent links of every node under node, so the tree holds no cycles."
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            node["parent"] = None
+            nodes.extend(node["child_list"])
+
     def expansion(self, node):
         state = node["state"]
         chose_action = None
@@ -520,7 +877,7 @@ class MCTSAgent(Agent):
                     legal.remove(action)
 
         chose_action = legal[random.randint(0,len(legal)-1)]
-        instances = state.generatePacmanSuccessor(chose_action)
+        instances = self.session.generatePacmanSuccessor(state, chose_action, True)
 
         if instances is None:
             self.flag = False
@@ -535,6 +892,7 @@ class MCTSAgent(Agent):
         sub_node["score"] = 0
         sub_node["action_list"] = []
         sub_node["child_list"] =[]
+        sub_node["exhausted"] = instances.isWin() or instances.isLose()
 
         node["child_list"].append(sub_node)
 
@@ -547,8 +905,10 @@ class MCTSAgent(Agent):
 
     #selection
     def selection(self,node,c):
-        children = node["child_list"]
+        # Children with nothing left to search are not selected again
+        children = [child for child in node["child_list"] if not child["exhausted"]]
         maxi = -9999
+        ret_node = None
         for i in children:
 
             exploitation = normalizedScoreEvaluation(node["state"],i["state"])
@@ -562,51 +922,68 @@ class MCTSAgent(Agent):
 
     #tree policy
     def treePolicy(self,node):
+        if node["exhausted"]:
+            return None
         while node["state"].isWin() + node["state"].isLose() == 0:
             if node["children"] == False:
                 return self.expansion(node)
             else:
                 node = self.selection(node,1)
-                if node["state"] is None:
+                if node is None or node["state"] is None:
                     return None
         return node
 
     #Default Policy
     def defaultPolicy(self,state):
+        # The states met on the way are not kept and go back to the session's pool
+        start = state
         rollout = 0
         while rollout < 5:
             if state.isWin() or state.isLose():
-                return scoreEvaluation(state)
+                break
             else:
                 legal = state.getLegalPacmanActions()
                 if legal:
                     random_action = legal[random.randint(0, len(legal) - 1)]
-                    state = state.generatePacmanSuccessor(random_action)
+                    successor = state.generateLazyPacmanSuccessor(random_action, horizon=rolloutHorizon(5 - rollout))
+                    if state is not start: self.session.release(state)
+                    state = successor
                     if state is None:
                         self.flag = False
                         return 0
             rollout = rollout + 1
-        return scoreEvaluation(state)
+        score = scoreEvaluation(state)
+        if state is not start: self.session.release(state)
+        return score
 
     def backup(self,node,score):
         while node:
             node["score"] = node["score"] + score
             node["visited"] = node["visited"] + 1
+            if node["children"] and not [child for child in node["child_list"] if not child["exhausted"]]:
+                node["exhausted"] = True
             node = node["parent"]
 
     # GetAction Function: Called with every frame
+    @searchWindow
     def getAction(self, state):
         # TODO: write MCTS Algorithm instead of returning Directions.STOP
         self.flag = True
-        node = {}
-        node["parent"] = None
-        node["action"] = None
-        node["visited"] = 0
-        node["state"] = state
-        node["score"] = 0
-        node["children"] = False
-        node["child_list"] = []
-        node["action_list"] = []
+        node = self.reuseTree(state)
+        if node is not None:
+            self.reusedVisits = node["visited"]
+        else:
+            self.reusedVisits = 0
+            node = {}
+            node["parent"] = None
+            node["action"] = None
+            node["visited"] = 0
+            node["state"] = searchRoot(state)
+            node["score"] = 0
+            node["children"] = False
+            node["child_list"] = []
+            node["action_list"] = []
+            node["exhausted"] = False
 
 
         while self.flag:
@@ -620,13 +997,25 @@ class MCTSAgent(Agent):
 
 
         maxi = -9999
+        result = Directions.STOP
+        chosen = None
         action_list = node["action_list"]
         child_list = node["child_list"]
         for i in range(len(node["action_list"])):
             action = action_list[i]
             child = child_list[i]
             visits = child["visited"]
+            if child["state"].isWin():
+                visits = float('inf') # Searched once, but nothing beats it
             if visits > maxi:
                 maxi = visits
                 result = action
-        return result
\ No newline at end of file
+                chosen = i
+        if chosen is not None:
+            # By index: comparing the dicts would walk their subtrees
+            self.tree = child_list[chosen]
+            del child_list[chosen]
+            del action_list[chosen]
+            self.tree["parent"] = None
+        self.releaseTree(node)
+        return result
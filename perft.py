@@ -0,0 +1,257 @@
+# perft.py
+# --------
+# Counts the game tree of the forward model, times it and cross-checks engines.
+
+"""
+perft expands every Pacman move from the start of a layout down to a fixed
+depth, one full round (Pacman's move and the ghosts' replies) per level, and
+reports how many states each level has, how fast they were made and an MD5
+checksum of all of them.  The ghosts draw from common random numbers (see
+GameState.withCommonRandomNumbers), so the tree depends only on the layout,
+the number of ghosts, the seed and the depth.
+
+Each engine builds the same tree its own way.  The first engine listed is
+the reference; every other one is compared with it state by state, level by
+level, and the first difference is reported:
+
+  python perft.py -l mediumClassic -k 2 -d 6 -e reference,default,undo,batch
+
+Engines:
+  reference   GameState with float positions and Grid food
+  default     GameState as the game runs it (fixed point, bitboard food)
+  fixedpoint  fixed point positions only
+  bitboard    bitboard food only
+  undo        SearchState apply/undo, depth first
+  batch       batchEngine.BatchGameState, one array step per level (NumPy)
+
+With --noChecksum nothing but the states is computed, for timing.
+"""
+
+import sys
+import time
+import hashlib
+import pacman
+import layout
+from game import Actions
+from game import Game
+from game import GameStateData
+
+def canonicalState(state):
+    """
+    Returns a string describing a GameState the same way for every engine:
+    score, win and lose, each agent's position in half cells, direction code
+    and scared timer, the capsules and the food bits (bit x*height+y).
+    """
+    data = state.data
+    values = [data.score, data._win, data._lose]
+    for agentState in data.agentStates:
+        x, y = agentState.configuration.pos
+        values += [int(x * 2), int(y * 2), Actions.actionToCode(agentState.configuration.direction),
+                   agentState.scaredTimer]
+    for x, y in sorted(data.capsules):
+        values += [x, y]
+    height = data.layout.height
+    food = 0
+    for x, y in data.food.asList():
+        food |= 1 << (x * height + y)
+    values.append(food)
+    return ','.join(['%d' % v for v in values])
+
+class GameStateEngine:
+    """
+    Builds the tree level by level with generatePacmanSuccessor, under the
+    given settings of pacman.FIXED_POINT and GameStateData.BITBOARD_FOOD.
+    """
+    def __init__(self, fixedPoint, bitboardFood):
+        self.fixedPoint = fixedPoint
+        self.bitboardFood = bitboardFood
+
+    def run(self, layout, numGhosts, seed, depth, checksum=True):
+        oldSettings = pacman.FIXED_POINT, GameStateData.BITBOARD_FOOD
+        pacman.FIXED_POINT, GameStateData.BITBOARD_FOOD = self.fixedPoint, self.bitboardFood
+        try:
+            root = pacman.GameState()
+            root.initialize(layout, numGhosts)
+            level = [root.withCommonRandomNumbers(seed)]
+            levels = [self.describe(level, checksum)]
+            elapsed = 0.0
+            for d in range(depth):
+                start = time.time()
+                nextLevel = []
+                for state in level:
+                    if state.isWin() or state.isLose(): continue
+                    for action in state.getLegalPacmanActions():
+                        nextLevel.append(state.generatePacmanSuccessor(action, True))
+                elapsed += time.time() - start
+                level = nextLevel
+                levels.append(self.describe(level, checksum))
+            return levels, elapsed
+        finally:
+            pacman.FIXED_POINT, GameStateData.BITBOARD_FOOD = oldSettings
+
+    def describe(self, level, checksum):
+        if checksum: return [canonicalState(state) for state in level]
+        return [None] * len(level)
+
+class UndoEngine:
+    "Walks the tree depth first on one SearchState with apply and undo."
+    def run(self, layout, numGhosts, seed, depth, checksum=True):
+        root = pacman.GameState()
+        root.initialize(layout, numGhosts)
+        state = pacman.SearchState(root.withCommonRandomNumbers(seed))
+        levels = [[] for d in range(depth + 1)]
+        # Describing the states is left out of the time, as for the other engines
+        self.describing = 0.0
+        start = time.time()
+        self.search(state, 0, depth, levels, checksum)
+        return levels, time.time() - start - self.describing
+
+    def search(self, state, d, depth, levels, checksum):
+        if checksum:
+            start = time.time()
+            levels[d].append(canonicalState(state))
+            self.describing += time.time() - start
+        else: levels[d].append(None)
+        if d == depth or state.isWin() or state.isLose(): return
+        for action in state.getLegalPacmanActions():
+            record = state.apply(action, True)
+            self.search(state, d + 1, depth, levels, checksum)
+            state.undo(record)
+
+class BatchEngine:
+    """
+    Builds each level as one BatchGameState: every game of the level above is
+    repeated once per legal move and stepped once, with the ghosts' uniforms
+    taken from the same common random numbers.
+    """
+    def run(self, layout, numGhosts, seed, depth, checksum=True):
+        import numpy as np
+        import batchEngine
+        root = pacman.GameState()
+        root.initialize(layout, numGhosts)
+        root = root.withCommonRandomNumbers(seed)
+        crn = root.getRandomContext()[0]
+        batch = batchEngine.BatchGameState.fromGameStates([root])
+        levels = [self.describe(batch, checksum)]
+        elapsed = 0.0
+        for d in range(depth):
+            start = time.time()
+            legal = batch.getLegalPacmanMask()
+            games, actions = np.nonzero(legal)
+            batch = batch.take(games)
+            uniforms = [crn.sample(d + 1, index) for index in range(1, batch.numAgents)]
+            batch.step(actions, np.tile(uniforms, (batch.numStates, 1)))
+            elapsed += time.time() - start
+            levels.append(self.describe(batch, checksum))
+        return levels, elapsed
+
+    def describe(self, batch, checksum):
+        if not checksum: return [None] * batch.numStates
+        import numpy as np
+        height = batch.tables.height
+        states = []
+        for n in range(batch.numStates):
+            values = [batch.score[n], batch.win[n], batch.lose[n]]
+            for index in range(batch.numAgents):
+                values += [batch.posX[n, index], batch.posY[n, index],
+                           batch.direction[n, index], batch.scared[n, index]]
+            for cell in np.nonzero(batch.capsules[n])[0]:
+                values += divmod(int(cell), height)
+            food = 0
+            for cell in np.nonzero(batch.food[n])[0]:
+                food |= 1 << int(cell)
+            values.append(food)
+            states.append(','.join(['%d' % v for v in values]))
+        return states
+
+ENGINES = {'reference': GameStateEngine(False, False),
+           'default': GameStateEngine(True, True),
+           'fixedpoint': GameStateEngine(True, False),
+           'bitboard': GameStateEngine(False, True),
+           'undo': UndoEngine(),
+           'batch': BatchEngine()}
+
+def perft(engineName, layout, numGhosts, seed, depth, checksum=True):
+    """
+    Runs an engine and returns (levels, seconds, digest), where levels holds
+    the canonical states of every depth in order (None without checksum).
+    """
+    oldIterations = Game.currentIterations
+    Game.currentIterations = sys.maxint
+    try:
+        levels, elapsed = ENGINES[engineName].run(layout, numGhosts, seed, depth, checksum)
+    finally:
+        Game.currentIterations = oldIterations
+    digest = hashlib.md5()
+    if checksum:
+        for level in levels:
+            for state in level:
+                digest.update(state)
+                digest.update(';')
+            digest.update('|')
+    return levels, elapsed, digest.hexdigest()
+
+def firstDifference(levels, referenceLevels):
+    "Returns (depth, index, state, reference state) of the first difference, or None."
+    for d in range(len(referenceLevels)):
+        level, reference = levels[d], referenceLevels[d]
+        for i in range(max(len(level), len(reference))):
+            state = i < len(level) and level[i] or None
+            expected = i < len(reference) and reference[i] or None
+            if state != expected: return d, i, state, expected
+    return None
+
+def readCommand(argv):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python perft.py <options>
+    EXAMPLES:   python perft.py -l mediumClassic -d 6
+                python perft.py -l originalClassic -k 4 -d 5 -e default,batch --noChecksum
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='the layout to search from (default mediumClassic)')
+    parser.add_option('-k', '--numghosts', type='int', dest='numGhosts', default=2,
+                      help='the maximum number of ghosts (default 2)')
+    parser.add_option('-s', '--seed', type='int', dest='seed', default=1,
+                      help='the seed of the ghosts\' random numbers (default 1)')
+    parser.add_option('-d', '--depth', type='int', dest='depth', default=5,
+                      help='the number of rounds to expand (default 5)')
+    parser.add_option('-e', '--engines', dest='engines', default='reference,default,undo',
+                      help='comma separated engines; the first is the reference (default reference,default,undo)')
+    parser.add_option('--noChecksum', action='store_false', dest='checksum', default=True,
+                      help='only count and time the states')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+def main(argv):
+    options = readCommand(argv)
+    board = layout.getLayout(options.layout)
+    if board == None: raise Exception("The layout " + options.layout + " cannot be found")
+    reference = None
+    mismatches = 0
+    for name in options.engines.split(','):
+        levels, elapsed, digest = perft(name, board, options.numGhosts, options.seed,
+                                        options.depth, options.checksum)
+        counts = [len(level) for level in levels]
+        nodes = sum(counts[1:])
+        rate = nodes / max(elapsed, 1e-9)
+        print '%-10s nodes %s  %.3fs  %d states/s' % (name, ' '.join([str(c) for c in counts]), elapsed, rate)
+        if not options.checksum: continue
+        print '%-10s checksum %s' % ('', digest)
+        if reference == None:
+            reference = levels
+            continue
+        difference = firstDifference(levels, reference)
+        if difference == None:
+            print '%-10s matches the reference' % ''
+        else:
+            mismatches += 1
+            d, i, state, expected = difference
+            print '%-10s DIFFERS at depth %d, state %d:\n    got      %s\n    expected %s' % ('', d, i, state, expected)
+    return mismatches
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]) and 1 or 0)
@@ -0,0 +1,128 @@
+# searchSession.py
+# ----------------
+# Garbage collector control and state recycling for the length of a search.
+
+"""
+A search builds many short-lived states, and search trees whose nodes point
+back at their parents are cyclic.  Python's cyclic garbage collector then runs
+again and again in the middle of a move, which shows up as pauses right at
+the move time limit.  A SearchSession holds the collector back for the length
+of one move and keeps a pool of states to reuse:
+
+  with SearchSession() as session:
+      child = session.generatePacmanSuccessor(state, action)
+      ...
+      session.release(child) # child is not used again
+
+  print session.getStats()
+
+release() is only for states that nothing refers to any more; a released
+state is overwritten by a later successor.  The searchWindow decorator runs a
+whole getAction in a session and keeps its statistics in agent.searchStats.
+"""
+
+import gc
+import time
+from game import Game
+from game import GameStateData
+from pacman import GameState
+
+MAX_POOL_SIZE = 4096 # released states kept for reuse
+
+class SearchSession:
+    """
+    Turns the cyclic garbage collector off (or, given thresholds, retunes it)
+    from entering the with block to leaving it, and pools released states.
+    Leaving the block with collect=True frees the garbage made during the
+    search with one collection of the given generation.
+    """
+    def __init__(self, thresholds=None, collect=False, generation=0):
+        self.thresholds = thresholds
+        self.collect = collect
+        self.generation = generation
+        self.pool = []
+        self.reused = 0
+        self.released = 0
+        self._stats = None
+
+    def __enter__(self):
+        self._wasEnabled = gc.isenabled()
+        self._oldThresholds = gc.get_threshold()
+        if self.thresholds == None:
+            gc.disable()
+        else:
+            gc.set_threshold(*self.thresholds)
+        self._startCreated = GameStateData.created
+        self._startTracked = gc.get_count()[0]
+        self._startTime = time.time()
+        self._stats = None
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self._stats = self.getStats()
+        del self.pool[:]
+        gc.set_threshold(*self._oldThresholds)
+        if self._wasEnabled: gc.enable()
+        if self.collect: gc.collect(self.generation)
+        return False
+
+    def generatePacmanSuccessor(self, state, action, trusted=False):
+        """
+        GameState.generatePacmanSuccessor, building the successor in a released
+        state when there is one.
+        """
+        Game.currentIterations -= 1
+        if Game.currentIterations <= 0:
+            return None
+        if state.isWin() or state.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+
+        if self.pool:
+            successor = self.pool.pop()
+            successor.data.__init__(state.data)
+            successor._drift = state._drift
+            successor._crn, successor._ply = state.getRandomContext()
+            self.reused += 1
+        else:
+            successor = GameState(state)
+        successor._applyRound(action, trusted)
+        return successor
+
+    def release(self, state):
+        "Hands back a state that will not be looked at again."
+        if state.__class__ is GameState and len(self.pool) < MAX_POOL_SIZE:
+            self.pool.append(state)
+            self.released += 1
+
+    def getStats(self):
+        """
+        Returns, for the session so far: the game state data initialized (new
+        or recycled), the states released to and reused from the pool, the
+        growth in objects tracked by the garbage collector (exact while it is
+        turned off), and the time taken.
+        """
+        if self._stats != None: return self._stats
+        return {'created': GameStateData.created - self._startCreated,
+                'reused': self.reused,
+                'released': self.released,
+                'tracked': gc.get_count()[0] - self._startTracked,
+                'time': time.time() - self._startTime}
+
+def searchWindow(getAction):
+    """
+    Decorates an agent's getAction to run inside a SearchSession, saving the
+    session's statistics in self.searchStats and passing the session on in
+    self.session for the length of the call.
+    """
+    def getActionInSession(self, state):
+        session = SearchSession()
+        with session:
+            self.session = session
+            try:
+                action = getAction(self, state)
+            finally:
+                self.session = None
+        self.searchStats = session.getStats()
+        return action
+    getActionInSession.__name__ = getAction.__name__
+    getActionInSession.__doc__ = getAction.__doc__
+    return getActionInSession
@@ -0,0 +1,118 @@
+# stateEncoding.py
+# ----------------
+# A compact, versioned binary encoding of game states.
+
+"""
+encodeState turns a GameState into a short byte string and decodeState turns
+it back, for shipping states between processes or storing them in datasets.
+Instead of the layout itself the encoding holds the layout's hash
+(Layout.layoutHash); the decoding process must have built the same layout
+(layout.getLayout does), or decodeState raises.
+
+Version 1, little-endian:
+
+  header   magic 'PS', version, flags (1 win, 2 lose), layout hash (Q),
+           score (q), agents, capsules, food bytes (H)
+  agents   per agent: x and y in half cells (h), direction code, flags
+           (1 float position), scared timer, carrying, returned (H)
+  capsules per capsule: x, y
+  food     the food bits (bit x * height + y), big-endian
+
+decodeState reads through struct.unpack_from, so it takes a str, bytearray,
+mmap or memoryview and decodes in place from any offset without copying;
+the food bits are read eight bytes at a time (unpackBits).
+"""
+
+import struct
+import binascii
+import layout
+from game import Actions
+from game import Configuration
+from game import GameStateData
+from game import BitGrid
+from pacman import GameState
+
+ENCODING_MAGIC = 'PS'
+ENCODING_VERSION = 1
+
+HEADER = struct.Struct('<2sBBQqBBH')
+AGENT = struct.Struct('<hhBBHHH')
+CAPSULE = struct.Struct('<BB')
+
+def encodeState(state):
+    "Returns the encoding of a GameState as a str."
+    data = state.data
+    height = data.layout.height
+    numFoodBytes = (data.layout.width * height + 7) // 8
+    flags = (data._win and 1 or 0) | (data._lose and 2 or 0)
+    parts = [HEADER.pack(ENCODING_MAGIC, ENCODING_VERSION, flags, data.layout.layoutHash,
+                         int(data.score), len(data.agentStates), len(data.capsules), numFoodBytes)]
+    for agentState in data.agentStates:
+        configuration = agentState.configuration
+        x, y = configuration.pos
+        agentFlags = type(x) is float and 1 or 0
+        parts.append(AGENT.pack(int(x * 2), int(y * 2), Actions.actionToCode(configuration.direction),
+                                agentFlags, agentState.scaredTimer, agentState.numCarrying,
+                                agentState.numReturned))
+    for x, y in data.capsules:
+        parts.append(CAPSULE.pack(x, y))
+    food = data.food
+    if isinstance(food, BitGrid): bits = food.bits
+    else: bits = BitGrid.fromGrid(food).bits
+    parts.append(binascii.unhexlify('%0*x' % (2 * numFoodBytes, bits)))
+    return ''.join(parts)
+
+def unpackBits(buffer, offset, numBytes):
+    "Returns the big-endian unsigned integer in numBytes bytes of buffer at offset."
+    numWords, numTail = divmod(numBytes, 8)
+    bits = 0
+    for word in struct.unpack_from('>%dQ' % numWords, buffer, offset):
+        bits = bits << 64 | word
+    for byte in struct.unpack_from('>%dB' % numTail, buffer, offset + 8 * numWords):
+        bits = bits << 8 | byte
+    return bits
+
+def decodeState(buffer, offset=0):
+    """
+    Returns the GameState encoded in buffer at offset.  Raises an Exception if
+    the encoding is not a known version or names an unknown layout.
+    """
+    (magic, version, flags, layoutHash, score, numAgents, numCapsules,
+     numFoodBytes) = HEADER.unpack_from(buffer, offset)
+    if magic != ENCODING_MAGIC or version != ENCODING_VERSION:
+        raise Exception('Not a version %d state encoding' % ENCODING_VERSION)
+    board = layout.getLayoutByHash(layoutHash)
+    if board == None:
+        raise Exception('Unknown layout %016x; load it before decoding' % layoutHash)
+    offset += HEADER.size
+
+    state = GameState()
+    data = state.data
+    data.initialize(board, numAgents - 1)
+    for agentState in data.agentStates:
+        hx, hy, code, agentFlags, scaredTimer, numCarrying, numReturned = AGENT.unpack_from(buffer, offset)
+        offset += AGENT.size
+        if agentFlags & 1: position = (hx / 2.0, hy / 2.0)
+        else: position = (hx // 2, hy // 2)
+        agentState.configuration = Configuration(position, Actions.codeToAction(code))
+        agentState.scaredTimer = scaredTimer
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+    data.capsules = []
+    for i in range(numCapsules):
+        data.capsules.append(CAPSULE.unpack_from(buffer, offset))
+        offset += CAPSULE.size
+    food = BitGrid(board.width, board.height, unpackBits(buffer, offset, numFoodBytes))
+    if not GameStateData.BITBOARD_FOOD: food = food.toGrid()
+    data.food = food
+    data.score = score
+    data._win = flags & 1 == 1
+    data._lose = flags & 2 == 2
+    data._zobrist = data._computeZobrist()
+    return state
+
+def encodedSize(buffer, offset=0):
+    "Returns the length in bytes of the encoding at offset, for reading a stream of them."
+    header = HEADER.unpack_from(buffer, offset)
+    numAgents, numCapsules, numFoodBytes = header[5:]
+    return HEADER.size + numAgents * AGENT.size + numCapsules * CAPSULE.size + numFoodBytes
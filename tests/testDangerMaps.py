@@ -0,0 +1,131 @@
+# testDangerMaps.py
+# -----------------
+# Run from the top directory: python -m unittest discover -s tests
+
+import random
+import unittest
+import layout
+import dangerMaps
+from pacman import GameState
+from ghostAgents import DirectionalGhost
+
+def makeEdges(model):
+    edges = {}
+    for source, destination, probability in zip(model.sources, model.destinations, model.probabilities):
+        edges.setdefault(int(source), []).append((int(destination), probability))
+    return edges
+
+def walk(edges, state, rng):
+    u = rng.random()
+    for destination, probability in edges[state]:
+        u -= probability
+        if u < 0: break
+    return destination
+
+def sampleReach(model, start, k, numWalks, rng):
+    "Returns the fraction of numWalks walks of the model's chain from start that visit each cell within k moves."
+    edges = makeEdges(model)
+    counts = [0] * model.numCells
+    for n in range(numWalks):
+        state = start
+        visited = set([state // dangerMaps.NUM_ACTIONS])
+        for move in range(k):
+            state = walk(edges, state, rng)
+            visited.add(state // dangerMaps.NUM_ACTIONS)
+        for cell in visited: counts[cell] += 1
+    return [float(count) / numWalks for count in counts]
+
+def sampleOccupancy(model, start, k, numWalks, rng):
+    "Returns the fraction of numWalks walks of the model's chain from start that end on each cell after k moves."
+    edges = makeEdges(model)
+    counts = [0] * model.numCells
+    for n in range(numWalks):
+        state = start
+        for move in range(k):
+            state = walk(edges, state, rng)
+        counts[state // dangerMaps.NUM_ACTIONS] += 1
+    return [float(count) / numWalks for count in counts]
+
+def startOfGhost(board, model):
+    state = GameState()
+    state.initialize(board, 2)
+    return model.getStartState(state.data.agentStates[1].configuration)
+
+class ReachProbabilityTest(unittest.TestCase):
+    def testMatchesMonteCarloWalks(self):
+        board = layout.getLayout('mediumClassic')
+        state = GameState()
+        state.initialize(board, 2)
+        model = dangerMaps.getGhostModel(board)
+        start = model.getStartState(state.data.agentStates[1].configuration)
+        rng = random.Random(5)
+        numWalks = 20000
+        for k in [1, 4, 10]:
+            exact = model.getReachProbabilities(start, k)
+            sampled = sampleReach(model, start, k, numWalks, rng)
+            # Five standard errors of a proportion estimated from numWalks walks
+            self.assertTrue(max([abs(p - q) for p, q in zip(exact, sampled)]) < 5 * 0.5 / numWalks ** 0.5)
+
+    def testProbabilitiesAreProbabilities(self):
+        board = layout.getLayout('mediumClassic')
+        state = GameState()
+        state.initialize(board, 2)
+        danger = dangerMaps.getDangerMap(state, 20)
+        self.assertTrue(danger.probabilities.min() >= 0)
+        self.assertTrue(danger.probabilities.max() <= 1 + 1e-9)
+
+class OccupancyTest(unittest.TestCase):
+    def testMatchesMonteCarloWalks(self):
+        board = layout.getLayout('mediumClassic')
+        model = dangerMaps.getGhostModel(board)
+        start = startOfGhost(board, model)
+        rng = random.Random(6)
+        numWalks = 20000
+        for k in [0, 1, 4, 10]:
+            exact = model.getOccupancy(start, k)
+            sampled = sampleOccupancy(model, start, k, numWalks, rng)
+            self.assertTrue(max([abs(p - q) for p, q in zip(exact, sampled)]) < 5 * 0.5 / numWalks ** 0.5)
+            self.assertAlmostEqual(exact.sum(), 1.0)
+
+    def testOccupancyIsAtMostReach(self):
+        board = layout.getLayout('mediumClassic')
+        model = dangerMaps.getGhostModel(board)
+        start = startOfGhost(board, model)
+        for k in [1, 6, 15]:
+            self.assertTrue((model.getOccupancy(start, k) <= model.getReachProbabilities(start, k) + 1e-9).all())
+
+    def testOccupancyMapIsAProbability(self):
+        state = GameState()
+        state.initialize(layout.getLayout('mediumClassic'), 2)
+        occupancy = dangerMaps.getOccupancyMap(state, 8)
+        self.assertTrue(occupancy.probabilities.min() >= 0)
+        self.assertTrue(occupancy.probabilities.max() <= 1 + 1e-9)
+
+class CacheTest(unittest.TestCase):
+    def testDirectionalModelsAreBounded(self):
+        board = layout.getLayout('smallClassic')
+        ghost = DirectionalGhost(1)
+        cells = board.walls.asList(False)[:dangerMaps.MAX_DIRECTIONAL_MODELS + 3]
+        for cell in cells:
+            dangerMaps.getGhostModel(board, ghost, cell)
+        self.assertEqual(len(dangerMaps._DIRECTIONAL_MODELS), dangerMaps.MAX_DIRECTIONAL_MODELS)
+        # The last cell used is still cached, the first is not
+        self.assertTrue(dangerMaps.getGhostModel(board, ghost, cells[-1]) is
+                        dangerMaps.getGhostModel(board, ghost, cells[-1]))
+        self.assertFalse((board, cells[0], ghost.prob_attack) in dangerMaps._DIRECTIONAL_MODELS)
+
+    def testPropagationsStayWithinTheByteBudget(self):
+        board = layout.getLayout('mediumClassic')
+        model = dangerMaps.GhostModel(board)
+        oldBudget = dangerMaps.MAX_CACHED_BYTES
+        dangerMaps.MAX_CACHED_BYTES = 2 ** 20
+        try:
+            for start in model.stateIds[:40]:
+                model.getReachProbabilities(int(start), 10)
+                self.assertTrue(model.cachedBytes <= dangerMaps.MAX_CACHED_BYTES)
+            self.assertEqual(model.cachedBytes, sum(model._cacheSizes.values()))
+        finally:
+            dangerMaps.MAX_CACHED_BYTES = oldBudget
+
+if __name__ == '__main__':
+    unittest.main()
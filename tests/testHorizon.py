@@ -0,0 +1,69 @@
+# testHorizon.py
+# --------------
+# Run from the top directory: python -m unittest discover -s tests
+
+import sys
+import random
+import unittest
+import layout
+from pacman import GameState
+from game import Game
+
+def visible(state, exactGhosts):
+    "What a rollout with a horizon must get exactly right: all but the frozen ghosts' positions."
+    data = state.data
+    ghosts = [(i, data.agentStates[i].configuration.pos) for i in exactGhosts]
+    timers = [agentState.scaredTimer for agentState in data.agentStates]
+    return (state.getPacmanPosition(), data.food.asList(), sorted(data.capsules), data.score,
+            state.isWin(), state.isLose(), timers, ghosts)
+
+class HorizonTest(unittest.TestCase):
+    def setUp(self):
+        self.oldIterations = Game.currentIterations
+        Game.currentIterations = sys.maxint
+
+    def tearDown(self):
+        Game.currentIterations = self.oldIterations
+
+    def startStates(self, rng):
+        state = GameState()
+        state.initialize(layout.getLayout('originalClassic'), 4)
+        starts = []
+        while len(starts) < 60:
+            if state.isWin() or state.isLose():
+                state = GameState()
+                state.initialize(layout.getLayout('originalClassic'), 4)
+            state = state.generatePacmanSuccessor(rng.choice(state.getLegalPacmanActions()))
+            starts.append(state)
+            # The same state with every ghost frightened
+            scared = state.makeObservation()
+            for index in range(1, scared.getNumAgents()):
+                scared.data.setScaredTimer(index, 10)
+            starts.append(scared)
+        return [start for start in starts if not (start.isWin() or start.isLose())]
+
+    def checkRollouts(self, lazy):
+        rng = random.Random(3)
+        rounds = 5
+        for start in self.startStates(rng):
+            seed = rng.getrandbits(64)
+            exact = start.withCommonRandomNumbers(seed)
+            approximate = start.withCommonRandomNumbers(seed)
+            for r in range(rounds):
+                action = rng.choice(exact.getLegalPacmanActions())
+                exact = exact.generatePacmanSuccessor(action)
+                if lazy: approximate = approximate.generateLazyPacmanSuccessor(action, horizon=rounds - r)
+                else: approximate = approximate.generatePacmanSuccessor(action, horizon=rounds - r)
+                drift = approximate._drift or [0] * approximate.getNumAgents()
+                exactGhosts = [i for i in range(1, approximate.getNumAgents()) if drift[i] == 0]
+                self.assertEqual(visible(approximate, exactGhosts), visible(exact, exactGhosts))
+                if exact.isWin() or exact.isLose(): break
+
+    def testApproximateRolloutsMatchExactOnes(self):
+        self.checkRollouts(False)
+
+    def testApproximateLazyRolloutsMatchExactOnes(self):
+        self.checkRollouts(True)
+
+if __name__ == '__main__':
+    unittest.main()
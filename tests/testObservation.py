@@ -0,0 +1,52 @@
+# testObservation.py
+# ------------------
+# Run from the top directory: python -m unittest discover -s tests
+
+import unittest
+import layout
+from pacman import ClassicGameRules
+from pacman import Directions
+from game import Agent
+from ghostAgents import RandomGhost
+from textDisplay import NullGraphics
+
+def snapshot(state):
+    data = state.data
+    return (data.food.asList(), list(data.capsules), data.score,
+            [(a.configuration, a.scaredTimer, a.numCarrying) for a in data.agentStates])
+
+class TamperingAgent(Agent):
+    "Writes to everything it can reach through its observations, then stops the game."
+    def __init__(self, test):
+        self.test = test
+        self.moves = 0
+
+    def getAction(self, observation):
+        live = self.game.state
+        before = snapshot(live)
+        for x, y in observation.getFood().asList()[:3]:
+            observation.getFood()[x][y] = False
+        for index in range(1, observation.getNumAgents()):
+            observation.getGhostState(index).scaredTimer = 7
+        observation.getPacmanState().numCarrying = 5
+        del observation.getCapsules()[:]
+        self.test.assertEqual(snapshot(live), before)
+        self.moves += 1
+        if self.moves == 10: self.game.gameOver = True
+        legal = observation.getLegalPacmanActions()
+        if Directions.WEST in legal: return Directions.WEST
+        return legal[0]
+
+class ObservationTest(unittest.TestCase):
+    def testWritesDoNotReachTheGame(self):
+        pacman = TamperingAgent(self)
+        ghosts = [RandomGhost(1), RandomGhost(2)]
+        game = ClassicGameRules().newGame(layout.getLayout('mediumClassic'), pacman, ghosts,
+                                          NullGraphics(), quiet=True)
+        pacman.game = game
+        game.run()
+        self.assertEqual(pacman.moves, 10)
+        self.assertEqual(game.state.getNumFood(), len(game.state.getFood().asList()))
+
+if __name__ == '__main__':
+    unittest.main()
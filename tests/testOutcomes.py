@@ -0,0 +1,53 @@
+# testOutcomes.py
+# ---------------
+# Run from the top directory: python -m unittest discover -s tests
+
+import unittest
+import layout
+from pacman import GameState
+from game import Game
+from game import GameStateData
+from ghostAgents import DirectionalGhost
+
+def startState():
+    state = GameState()
+    state.initialize(layout.getLayout('mediumClassic'), 2)
+    return state
+
+class OutcomeBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.oldIterations = Game.currentIterations
+
+    def tearDown(self):
+        Game.currentIterations = self.oldIterations
+
+    def testEveryOutcomeCostsOneCall(self):
+        state = startState()
+        for ghostAgents in [None, [DirectionalGhost(1), DirectionalGhost(2)]]:
+            Game.currentIterations = 1000
+            outcomes = state.generatePacmanOutcomes(state.getLegalPacmanActions()[0], ghostAgents)
+            self.assertEqual(Game.currentIterations, 1000 - len(outcomes))
+            self.assertAlmostEqual(sum([p for outcome, p in outcomes]), 1.0)
+
+    def testSpentBudgetDoesNoWork(self):
+        state = startState()
+        Game.currentIterations = 0
+        created = GameStateData.created
+        self.assertEqual(state.generatePacmanOutcomes(state.getLegalPacmanActions()[0]), None)
+        self.assertEqual(GameStateData.created, created)
+        self.assertEqual(Game.currentIterations, -1)
+
+    def testStopsWhenTheBudgetRunsOut(self):
+        state = startState()
+        Game.currentIterations = 10 ** 6
+        # Play on until the ghosts have a choice of replies
+        while True:
+            action = state.getLegalPacmanActions()[0]
+            if len(state.generatePacmanOutcomes(action)) > 2: break
+            state = state.generatePacmanSuccessor(action)
+        Game.currentIterations = 2
+        self.assertEqual(state.generatePacmanOutcomes(action), None)
+        self.assertEqual(Game.currentIterations, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# testStateEncoding.py
+# --------------------
+# Run from the top directory: python -m unittest discover -s tests
+
+import random
+import unittest
+import layout
+import stateEncoding
+from pacman import GameState
+from game import Game
+
+class RoundTripTest(unittest.TestCase):
+    def testDecodesWhatWasEncoded(self):
+        oldIterations = Game.currentIterations
+        Game.currentIterations = 10 ** 9
+        rng = random.Random(4)
+        try:
+            for name in ['smallClassic', 'mediumClassic', 'originalClassic']:
+                state = GameState()
+                state.initialize(layout.getLayout(name), 2)
+                for move in range(30):
+                    if state.isWin() or state.isLose(): break
+                    encoded = stateEncoding.encodeState(state)
+                    # Decoded in place from the middle of a larger buffer
+                    buffer = bytearray('junk' + encoded + 'junk')
+                    decoded = stateEncoding.decodeState(memoryview(buffer), 4)
+                    self.assertEqual(stateEncoding.encodedSize(buffer, 4), len(encoded))
+                    self.assertTrue(decoded == state)
+                    self.assertEqual(decoded.getFood(), state.getFood())
+                    self.assertEqual(stateEncoding.encodeState(decoded), encoded)
+                    state = state.generatePacmanSuccessor(rng.choice(state.getLegalPacmanActions()))
+        finally:
+            Game.currentIterations = oldIterations
+
+    def testUnpacksBitsOfAnyLength(self):
+        for numBytes in [0, 1, 7, 8, 9, 23]:
+            value = random.Random(numBytes).getrandbits(8 * numBytes + 1) >> 1
+            packed = ''.join([chr(value >> 8 * (numBytes - 1 - i) & 255) for i in range(numBytes)])
+            self.assertEqual(stateEncoding.unpackBits('x' + packed, 1, numBytes), value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# testTranspositionTable.py
+# -------------------------
+# Run from the top directory: python -m unittest discover -s tests
+
+import unittest
+import pacmanAgents
+from pacmanAgents import TranspositionTable
+
+def fill(table):
+    "Visits keys a, b, c in order, then a again."
+    for key in ['a', 'b', 'c']:
+        table.visit(key, 1)
+    table.visit('a', 2)
+
+class EvictionTest(unittest.TestCase):
+    def testFifoForgetsTheOldestKey(self):
+        table = TranspositionTable(3)
+        fill(table)
+        table.visit('d', 1)
+        self.assertEqual(list(table.depths), ['b', 'c', 'd'])
+        self.assertEqual(table.evicted, 1)
+
+    def testLruForgetsTheKeyVisitedLongestAgo(self):
+        table = TranspositionTable(3, lru=True)
+        fill(table)
+        table.visit('d', 1)
+        self.assertEqual(list(table.depths), ['c', 'a', 'd'])
+        self.assertEqual(table.evicted, 1)
+
+    def testLruCountsDuplicateChecksAsVisits(self):
+        table = TranspositionTable(3, lru=True)
+        for key in ['a', 'b', 'c']:
+            table.visit(key, 1)
+        self.assertTrue(table.isDuplicate('a', 1))
+        self.assertFalse(table.isDuplicate('e', 1))
+        table.visit('d', 1)
+        self.assertEqual(list(table.depths), ['c', 'a', 'd'])
+
+    def testSettingChoosesThePolicy(self):
+        oldSize, oldLru = pacmanAgents.TRANSPOSITION_TABLE_SIZE, pacmanAgents.TRANSPOSITION_TABLE_LRU
+        try:
+            pacmanAgents.TRANSPOSITION_TABLE_SIZE = 3
+            pacmanAgents.TRANSPOSITION_TABLE_LRU = True
+            self.assertTrue(pacmanAgents.makeTranspositionTable().lru)
+            pacmanAgents.TRANSPOSITION_TABLE_LRU = False
+            self.assertFalse(pacmanAgents.makeTranspositionTable().lru)
+            pacmanAgents.TRANSPOSITION_TABLE_SIZE = 0
+            self.assertEqual(pacmanAgents.makeTranspositionTable(), None)
+        finally:
+            pacmanAgents.TRANSPOSITION_TABLE_SIZE, pacmanAgents.TRANSPOSITION_TABLE_LRU = oldSize, oldLru
+
+if __name__ == '__main__':
+    unittest.main()